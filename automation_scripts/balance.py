@@ -0,0 +1,107 @@
+"""
+REACH manipulator load balancing
+
+Brings the four tendon forces read by the inline load cells to one
+setpoint, which with the tendons evenly loaded leaves the manipulator
+upright. By default the setpoint is the mean of the four forces. Every
+round the tendons more than tolerance away from it are moved together
+with one coordinated move, tightened if low and loosened if high.
+
+The step size adapts per tendon. The first moves use initial_step.
+After each move the force change is divided by the encoder change of
+that tendon, giving an estimate of its stiffness, and the next step is
+the one that estimate says will close the error. While there is no
+usable estimate, the step grows by half each round the error keeps its
+sign and halves when the error changes sign. Steps stay between
+min_step and max_step counts. session.tendons gives the tendon each
+load cell measures.
+
+A dead or miswired load cell never shows the force change a move
+should make. Balancing gives up, unbalanced, before a tendon has
+travelled more than max_travel counts in total, or once any force is
+above max_force.
+
+Usage:
+    result = balance_loads(session, mover, tolerance=0.5)
+    print(result.elapsed, result.rounds)
+"""
+
+import time
+from collections import namedtuple
+
+BalanceResult = namedtuple('BalanceResult', 'balanced rounds elapsed setpoint forces')
+
+
+# Tendon -> force, from the latest load cell samples
+def tendon_forces(session):
+    forces = session.forces()
+    return {tendon: f for tendon, f in zip(session.tendons, forces) if f is not None}
+
+
+def balance_loads(session, mover, setpoint=None, tolerance=0.5, initial_step=11520,
+                  min_step=500, max_step=46080, gain=0.8, max_rounds=40, settle=0.5,
+                  max_travel=4*46080, max_force=None):
+    start = time.monotonic()
+    travel = {}
+    step = {}
+    stiffness = {}
+    last_error = {}
+    forces = {}
+    target = setpoint
+    for rounds in range(max_rounds + 1):
+        time.sleep(settle)
+        forces = tendon_forces(session)
+        if not forces:
+            print("[WARNING] No load cell samples, cannot balance")
+            return BalanceResult(False, rounds, time.monotonic() - start, target, forces)
+        if max_force is not None and max(forces.values()) > max_force:
+            elapsed = time.monotonic() - start
+            print(f"[WARNING] Balancing stopped, a tendon force is above {max_force}: {forces}")
+            return BalanceResult(False, rounds, elapsed, target, forces)
+        target = setpoint if setpoint is not None else sum(forces.values()) / len(forces)
+        errors = {t: target - f for t, f in forces.items()}
+        if all(abs(e) <= tolerance for e in errors.values()):
+            elapsed = time.monotonic() - start
+            print(f"[BALANCE] Loads balanced at {target:.2f} in {elapsed:.1f} s, {rounds} rounds")
+            return BalanceResult(True, rounds, elapsed, target, forces)
+        if rounds == max_rounds:
+            break
+
+        deltas = {}
+        for t, e in errors.items():
+            if abs(e) <= tolerance:
+                continue
+            size = step.get(t, initial_step)
+            if t in last_error and (last_error[t] > 0) != (e > 0):
+                size /= 2
+            elif t in last_error and t not in stiffness:
+                size *= 1.5
+            if t in stiffness:
+                size = gain*abs(e)/stiffness[t]
+            size = int(max(min_step, min(max_step, size)))
+            step[t] = size
+            deltas[t] = size if e > 0 else -size
+        last_error = errors
+        over = [t for t, d in deltas.items() if travel.get(t, 0) + abs(d) > max_travel]
+        if over:
+            elapsed = time.monotonic() - start
+            print(f"[WARNING] Balancing stopped, tendons {over} would travel more than "
+                  f"{max_travel} counts: {forces}")
+            return BalanceResult(False, rounds, elapsed, target, forces)
+
+        before = forces
+        moved = mover.move(deltas)
+        time.sleep(settle)
+        after = tendon_forces(session)
+        # Force change per count of tightening, kept only when it makes sense
+        for t, enc_change in moved.items():
+            travel[t] = travel.get(t, 0) + abs(enc_change)
+            counts = enc_change*mover.tendons[t][3]
+            if abs(counts) >= min_step and t in before and t in after:
+                k = (after[t] - before[t]) / counts
+                if k > 0:
+                    stiffness[t] = k if t not in stiffness else (stiffness[t] + k) / 2
+
+    elapsed = time.monotonic() - start
+    print(f"[WARNING] Loads not balanced after {max_rounds} rounds ({elapsed:.1f} s): {forces}")
+    return BalanceResult(False, max_rounds, elapsed, target, forces)
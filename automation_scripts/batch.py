@@ -0,0 +1,249 @@
+"""
+REACH manipulator batch experiments
+
+Headless entry point that runs a queue of workspace experiments back to
+back, without the Xbox controller or the left trigger. The manipulator
+has to be aligned upright before the batch starts; that pose is taken
+as home. After every run all motors return home with one absolute
+move and the tendon loads are re-balanced, and the balanced pose
+becomes home for the next run.
+
+Every run gets its own directory under the results directory with the
+load cell CSV, the binary telemetry, the run journal and run.json, the
+experiment definition plus a summary (times, moves, failures, home
+error, balance).
+
+Usage:
+    python batch.py experiments.json [--sim]
+
+experiments.json:
+    {
+      "results": "results",
+      "experiments": [
+        {"name": "quarter_curved", "sequence": "workspace_sequence.json",
+         "motmov": 11520, "longitudinal_path": 5, "side_tendons_slack": 4,
+         "alternate": true, "output": "reach_load_cell.csv"},
+        {"name": "full_curved", "alternate": false}
+      ]
+    }
+
+Missing fields take the defaults in DEFAULTS, and motmov the one in the
+hardware profile.
+"""
+
+import json
+import os
+import sys
+import time
+import traceback
+
+import sim
+# Swap in the simulated rig before any hardware module is imported (--sim)
+sim.install_if_requested()
+import hardware
+from loadcells import LoadCellSession
+from sample_logger import BufferedCsvWriter
+from telemetry_log import TelemetryWriter
+from roboclaw_dispatch import Dispatcher
+from motion import DwellStats
+from status import ControllerStatus
+from coordinated import CoordinatedMover
+from sequences import compile_sequence, load_sequence, optimize, run_program
+from balance import balance_loads
+import home
+import journal
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULTS = {
+    "sequence": "workspace_sequence.json",
+    "longitudinal_path": 5,
+    "side_tendons_slack": None,
+    "alternate": True,
+    "optimize": True,
+    "output": "reach_load_cell.csv",
+    "line_pause": 3,
+}
+
+# Ports, addresses, speeds and calibration come from the hardware profile
+rig = hardware.connect(hardware.load_profile())
+rc1, add1 = rig.controller("rc1")
+rc2, add2 = rig.controller("rc2")
+
+dispatch = Dispatcher()
+dispatch.add(rc1, "rc1")
+dispatch.add(rc2, "rc2")
+
+controller_status = {
+    rc1: ControllerStatus(rc1, add1),
+    rc2: ControllerStatus(rc2, add2),
+}
+
+spd = rig.spd
+acc = rig.acc
+
+# Four load cell parameters from calibration
+gains = rig.gains
+offsets = rig.offsets
+
+# Load cell data interval (ms), a list for one per channel or 'max' for the
+# fastest rate of every bridge; change trigger 0 reports every sample
+load_cell_interval = 8
+load_cell_trigger = 0
+tension_settle = 0.25
+move_timeout = 10
+
+# Allowed spread of the loads when re-balancing between runs
+balance_tolerance = 0.5
+
+# Tendon -> (Roboclaw, address, channel, sign of the speed that tightens it)
+tendons = rig.tendons
+
+
+# The writers of the run in progress, the load cell session outlives them
+class RunLogs:
+    def __init__(self, directory, output):
+        self.csv = BufferedCsvWriter(os.path.join(directory, output),
+                                     ['Timestamp', 'LoadCell1', 'LoadCell2',
+                                      'LoadCell3', 'LoadCell4', 'Step'],
+                                     flush_interval=0.5)
+        self.telemetry = TelemetryWriter(os.path.join(directory, 'reach_telemetry.bin'))
+
+    def row(self, timestamp, step, forces):
+        self.csv.write([timestamp] + forces + [step])
+        self.telemetry.append(timestamp, step, forces)
+
+    def close(self):
+        self.csv.close()
+        self.telemetry.close()
+
+
+logs = None
+
+
+def log_load_cell(timestamp, step, forces):
+    if logs is not None:
+        logs.row(timestamp, step, forces)
+
+
+def set_encoder(tendon, count):
+    if logs is not None:
+        logs.telemetry.set_encoder(tendon, count)
+
+
+def read_encoders():
+    return home.capture(tendons, controller_status)
+
+
+def run_experiment(index, experiment, results, home_pose, session, mover):
+    global logs
+    exp = dict(DEFAULTS, motmov=rig.motmov)
+    exp.update(experiment)
+    name = exp.get("name", "run%d" % index)
+    directory = os.path.join(results, "%02d_%s_%s" % (index, name, time.strftime("%Y%m%d_%H%M%S")))
+    os.makedirs(directory)
+
+    sequence = exp["sequence"]
+    if not os.path.isabs(sequence):
+        sequence = os.path.join(HERE, sequence)
+    program = compile_sequence(load_sequence(sequence), exp["longitudinal_path"], exp["motmov"],
+                               alternate=exp["alternate"],
+                               side_tendons_slack=exp["side_tendons_slack"])
+    if exp["optimize"]:
+        program = optimize(program)
+
+    summary = {"experiment": exp, "directory": directory, "moves": len(program),
+               "started": time.strftime("%Y-%m-%d %H:%M:%S"), "completed": False}
+    print(f"[BATCH] Run {index} '{name}': {len(program)} moves -> {directory}")
+
+    logs = RunLogs(directory, exp["output"])
+    run_journal = journal.RunJournal(os.path.join(directory, 'reach_journal.jsonl'),
+                                     encoders=read_encoders, tendons=tendons)
+    run_journal.start(program, home_pose)
+    dwell = DwellStats(fixed_dwell=3)
+    mover.stats = dwell
+    start = time.monotonic()
+    session.start()
+    try:
+        def begin_step(moves):
+            session.mark_step(moves[0].step)
+            run_journal.begin(moves)
+
+        run_program(program, None, dispatch.barrier, line_pause=exp["line_pause"],
+                    move_vector=mover.move, on_step=begin_step,
+                    on_step_done=run_journal.commit)
+        summary["completed"] = True
+    except Exception as e:
+        traceback.print_exc()
+        summary["error"] = repr(e)
+    finally:
+        session.stop()
+        summary["duration"] = time.monotonic() - start
+        summary["dwell_saved"] = dwell.saved()
+
+        reached = home.move_to(home_pose, tendons, controller_status, dispatch,
+                               accel=spd, speed=acc, settle_time=tension_settle)
+        run_journal.home(reached)
+        run_journal.close()
+        summary["home_error"] = home.error(home_pose, reached)
+
+        balanced = balance_loads(session, mover, tolerance=balance_tolerance,
+                                 max_force=rig.max_force)
+        summary["balanced"] = balanced.balanced
+        summary["balance_rounds"] = balanced.rounds
+        summary["balance_time"] = balanced.elapsed
+
+        logs.close()
+        logs = None
+        # Serial link counters, cumulative since the batch started
+        summary["links"] = rig.health()
+        summary["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        with open(os.path.join(directory, 'run.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"[BATCH] Run {index} '{name}' {'completed' if summary['completed'] else 'FAILED'} "
+              f"in {summary['duration']:.0f} s, home error {summary['home_error']} counts")
+    return summary
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python batch.py experiments.json [--sim]")
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        batch = json.load(f)
+    results = batch.get("results", "results")
+    os.makedirs(results, exist_ok=True)
+
+    session = LoadCellSession(gains, offsets, on_row=log_load_cell,
+                              data_interval=load_cell_interval,
+                              change_trigger=load_cell_trigger,
+                              tendons=rig.load_cell_tendons)
+    mover = CoordinatedMover(tendons, controller_status, dispatch, spd, acc,
+                             settle_time=tension_settle, timeout=move_timeout,
+                             on_encoder=set_encoder)
+    summaries = []
+    try:
+        session.open()
+        session.report(session.measure_rates())
+        # The pose the rig was left in is the first home
+        home_pose = read_encoders()
+        print(f"[BATCH] {len(batch['experiments'])} experiments, home {home_pose}")
+        for index, experiment in enumerate(batch["experiments"], 1):
+            summaries.append(run_experiment(index, experiment, results, home_pose,
+                                            session, mover))
+            # The balanced pose is home for the next run
+            home_pose = read_encoders()
+    except KeyboardInterrupt:
+        print("Batch interrupted by user.")
+    finally:
+        rig.report_links()
+        dispatch.shutdown(wait=False)
+        session.close()
+        with open(os.path.join(results, 'batch.json'), 'w') as f:
+            json.dump(summaries, f, indent=2)
+    done = sum(s["completed"] for s in summaries)
+    print(f"[BATCH] {done} of {len(batch['experiments'])} runs completed")
+
+
+if __name__ == "__main__":
+    main()
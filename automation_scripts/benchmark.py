@@ -0,0 +1,164 @@
+"""
+REACH manipulator per-move latency benchmark
+
+Runs an automation script (against the simulated rig with --sim, or
+the real hardware) with profiling switched on, and breaks the time of
+every move down by phase:
+
+    serial:<Method>   each Roboclaw call, e.g. serial:ReadEncM1,
+                      serial:SpeedAccelDistanceM2
+    sleep             fixed dwells made with profiling.sleep() during the
+                      move (the settle and retry pauses of
+                      send_and_verify), part of phase:verify
+    load_cells        LoadCellSession hooks (mark_step), the remains of
+                      the old per-move voltageChange() re-attach
+    phase:verify      send_and_verify(), including retries
+    phase:wait        waiting for completion and tension settle
+
+The report is written as JSON with the per-move records and, for every
+phase, the call count, total and p50/p90/p99/max per move, plus the
+wall time of the whole run so changes to the scripts can be compared.
+Under --sim all times are virtual. Host side costs such as thread
+switches are stretched by the sim speedup, so each serial call is
+counted at the modelled round trip of the simulated link rather than
+timed, and the other phases are only comparable between simulated
+reports made with the same REACH_SIM_SPEEDUP.
+
+Usage:
+    python benchmark.py reach_ee_quarter_workspace_only_curved_checkmove_loadcells.py --sim
+    python benchmark.py <script> --out bench.json
+"""
+
+import argparse
+import functools
+import json
+import os
+import runpy
+import sys
+import time
+
+import profiling
+import sim
+
+SERIAL_METHODS = (
+    "SpeedAccelDistanceM1", "SpeedAccelDistanceM2", "SpeedAccelDistanceM1M2_2",
+    "SpeedAccelDeccelPositionM1", "SpeedAccelDeccelPositionM2",
+    "SpeedM1", "SpeedM2", "SpeedM1M2", "SpeedAccelM1M2",
+    "ReadEncM1", "ReadEncM2", "ReadSpeedM1", "ReadSpeedM2", "ReadBuffers",
+    "ReadEncoders", "ReadISpeeds",
+)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+# duration, if given, is recorded for every call instead of the measured time
+def _timed(name, fn, duration=None):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with profiling.timed(name, duration):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def instrument(serial_time=None):
+    import roboclaw_3
+    for method in SERIAL_METHODS:
+        original = getattr(roboclaw_3.Roboclaw, method, None)
+        if original is not None:
+            setattr(roboclaw_3.Roboclaw, method, _timed("serial:" + method, original, serial_time))
+
+    import loadcells
+    loadcells.LoadCellSession.mark_step = _timed("load_cells", loadcells.LoadCellSession.mark_step)
+
+    profiling.enabled = True
+
+
+def summarize(records, wall_time):
+    phases = {}
+    for record in records:
+        for name, (calls, seconds) in record.timings.items():
+            entry = phases.setdefault(name, {"calls": 0, "per_move": []})
+            entry["calls"] += calls
+            entry["per_move"].append(seconds)
+
+    summary = {}
+    for name, entry in sorted(phases.items()):
+        values = entry.pop("per_move")
+        summary[name] = {
+            "calls": entry["calls"],
+            "total": sum(values),
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "p99": percentile(values, 99),
+            "max": max(values),
+        }
+
+    durations = [r.end - r.start for r in records]
+    return {
+        "moves": len(records),
+        "attempts": sum(r.attempts for r in records),
+        "wall_time": wall_time,
+        "move_time": {
+            "total": sum(durations),
+            "p50": percentile(durations, 50),
+            "p90": percentile(durations, 90),
+            "p99": percentile(durations, 99),
+            "max": max(durations) if durations else 0.0,
+        },
+        "phases": summary,
+    }
+
+
+def print_summary(report):
+    print(f"[BENCH] {report['moves']} moves, {report['attempts']} attempts, "
+          f"run took {report['wall_time']:.1f} s")
+    m = report["move_time"]
+    print(f"[BENCH] move time p50 {m['p50']*1000:.0f} ms, p90 {m['p90']*1000:.0f} ms, "
+          f"p99 {m['p99']*1000:.0f} ms")
+    for name, p in report["phases"].items():
+        print(f"[BENCH]   {name:32s} {p['calls']:6d} calls  total {p['total']:8.2f} s  "
+              f"p50 {p['p50']*1000:7.1f} ms  p99 {p['p99']*1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-move latency benchmark for a REACH automation script")
+    parser.add_argument("script")
+    parser.add_argument("--sim", action="store_true", help="run against the simulated rig")
+    parser.add_argument("--out", default="benchmark_report.json")
+    parser.add_argument("--moves", action="store_true", help="include every move in the report")
+    args, script_args = parser.parse_known_args()
+
+    if args.sim:
+        sim.install(speedup=float(os.environ.get("REACH_SIM_SPEEDUP", sim.DEFAULT_SPEEDUP)),
+                    fail_rate=float(os.environ.get("REACH_SIM_FAIL_RATE", 0)))
+    instrument(serial_time=sim.settings["serial_latency"] if args.sim else None)
+
+    script = os.path.abspath(args.script)
+    sys.path.insert(0, os.path.dirname(script))
+    sys.argv = [script] + script_args
+    start = time.monotonic()
+    try:
+        runpy.run_path(script, run_name="__main__")
+    finally:
+        wall_time = time.monotonic() - start
+        report = summarize(profiling.records, wall_time)
+        report["script"] = os.path.basename(script)
+        report["simulated"] = args.sim
+        if args.moves:
+            report["records"] = [r.as_dict() for r in profiling.records]
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print_summary(report)
+        print(f"[BENCH] Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+REACH manipulator buffered line execution
+
+Alternative to verifying every step from the host. All moves of a
+longitudinal line are loaded into the Roboclaws' onboard command
+buffers (buffer flag 0, queued behind the running command), so each
+channel runs its moves back to back without a host round trip between
+them. The channels of both controllers run independently; the end of a
+line is the synchronisation point.
+
+While the line runs the host only monitors buffer depth and encoder
+counts, topping the buffers up if a line holds more moves than
+max_queue. The encoder trace recorded while monitoring is checked
+afterwards: whenever a channel's buffer depth shows commands have
+completed, the encoder change since the previous boundary is compared
+with the commanded distance, the same check send_and_verify() makes per
+step, only post hoc. The buffers are polled at least twice within the
+shortest queued move, so every move ends between two samples of the
+trace and is checked on its own, instead of merging with its
+neighbours into a span whose distances could cancel out. A span of
+moves that still cancel out is reported as not checked.
+
+Usage:
+    runner = BufferedLineRunner(tendons, controller_status, dispatch, spd, acc)
+    run_program_buffered(program, runner, line_pause=3)
+"""
+
+import time
+
+from motion import BUFFER_IDLE
+from sequences import steps
+from status import buffer, enc
+
+
+class ChannelPlan:
+    def __init__(self, rc, address, motor):
+        self.rc = rc
+        self.address = address
+        self.motor = motor
+        # (step, tendon, signed speed, distance)
+        self.moves = []
+        self.issued = 0
+        # (commands completed, encoder count, time, time since the poll
+        # before it); the commands completed somewhere in that window
+        self.trace = []
+
+    def queued(self, snap):
+        depth = buffer(snap, self.motor)
+        return 0 if depth == BUFFER_IDLE else depth + 1
+
+    # Shortest time the move at index can take, entered at full speed
+    # from the move queued before it
+    def duration(self, index):
+        step, tendon, speed, distance = self.moves[index]
+        return distance / abs(speed)
+
+    def send(self, accel, index):
+        step, tendon, speed, distance = self.moves[index]
+        if self.motor == 1:
+            self.rc.SpeedAccelDistanceM1(self.address, accel, speed, distance, 0)
+        else:
+            self.rc.SpeedAccelDistanceM2(self.address, accel, speed, distance, 0)
+
+
+class BufferedLineRunner:
+    def __init__(self, tendons, controller_status, dispatch, spd, acc,
+                 max_queue=32, poll_interval=0.05, timeout=120,
+                 tolerance=0.25, encoder_threshold=50, on_encoder=None):
+        self.tendons = tendons
+        self.controller_status = controller_status
+        self.dispatch = dispatch
+        self.spd = spd
+        self.acc = acc
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.tolerance = tolerance
+        self.encoder_threshold = encoder_threshold
+        # on_encoder(tendon, count) for every encoder sample, e.g. telemetry
+        self.on_encoder = on_encoder
+
+    def plan(self, moves):
+        plans = {}
+        for m in moves:
+            rc, address, motor, sign = self.tendons[m.tendon]
+            speed = sign*self.acc if m.distance > 0 else -sign*self.acc
+            plan = plans.setdefault((rc, motor), ChannelPlan(rc, address, motor))
+            plan.moves.append((m.step, m.tendon, speed, abs(m.distance)))
+        return plans
+
+    # Load and monitor every channel of one controller, runs on its worker
+    def _run_controller(self, rc, plans):
+        status = self.controller_status[rc]
+        status.invalidate()
+        snap = status.read(speeds=False)
+        for plan in plans:
+            plan.trace.append((0, enc(snap, plan.motor), snap.time, 0.0))
+        last_poll = snap.time
+
+        start = time.monotonic()
+        while True:
+            for plan in plans:
+                room = self.max_queue - plan.queued(snap)
+                while room > 0 and plan.issued < len(plan.moves):
+                    plan.send(self.spd, plan.issued)
+                    plan.issued += 1
+                    room -= 1
+            status.invalidate()
+            # Sample before the shortest queued move can end
+            queued = [plan.duration(i) for plan in plans
+                      for i in range(plan.trace[-1][0], plan.issued)]
+            time.sleep(min([self.poll_interval] + [d/2 for d in queued]))
+
+            snap = status.read(speeds=False)
+            window = snap.time - last_poll
+            last_poll = snap.time
+            done = True
+            for plan in plans:
+                completed = plan.issued - plan.queued(snap)
+                count = enc(snap, plan.motor)
+                if completed != plan.trace[-1][0]:
+                    plan.trace.append((completed, count, snap.time, window))
+                if self.on_encoder is not None:
+                    self.on_encoder(plan.moves[0][1], count)
+                if completed < len(plan.moves):
+                    done = False
+            if done:
+                break
+            if time.monotonic() - start > self.timeout:
+                print(f"[WARNING] Buffered line on {self.dispatch.names.get(rc, rc)} "
+                      f"still running after {self.timeout} s")
+                break
+        status.mark_settled()
+
+    # Compare the encoder change between buffer boundaries with the
+    # commanded distances. Returns a list of problems, empty if all good:
+    # mismatches with the expected and actual counts, anything else with
+    # a message.
+    def verify(self, plans):
+        problems = []
+        for plan in plans.values():
+            for (c0, e0, _, w0), (c1, e1, _, w1) in zip(plan.trace, plan.trace[1:]):
+                span = plan.moves[c0:c1]
+                steps = sorted({step for step, _, _, _ in span})
+                expected = sum(d if s > 0 else -d for _, _, s, d in span)
+                actual = e1 - e0
+                if expected == 0:
+                    # Moves that cancel out within one poll cannot be told
+                    # apart from moves that never ran, and show no travel
+                    # for encoder_threshold
+                    problems.append({
+                        "tendon": span[0][1], "steps": steps,
+                        "message": "%d moves ended between two samples, not checked" % len(span),
+                    })
+                    continue
+                # Each boundary is only known to within the polls either side
+                # of it, the motor runs on at full speed for at most that long
+                slack = self.tolerance*abs(expected) + abs(self.acc)*(w0 + w1)
+                if abs(actual - expected) > slack or abs(actual) < self.encoder_threshold:
+                    problems.append({
+                        "tendon": span[0][1], "steps": steps,
+                        "expected": expected,
+                        "actual": actual,
+                    })
+            completed = plan.trace[-1][0]
+            if completed < len(plan.moves):
+                problems.append({
+                    "tendon": plan.moves[0][1],
+                    "steps": sorted({m[0] for m in plan.moves[completed:]}),
+                    "message": "only %d of %d moves completed" % (completed, len(plan.moves)),
+                })
+        return problems
+
+    def run_line(self, moves):
+        plans = self.plan(moves)
+        by_controller = {}
+        for (rc, motor), plan in plans.items():
+            by_controller.setdefault(rc, []).append(plan)
+        for rc, rc_plans in by_controller.items():
+            self.dispatch.submit(rc, self._run_controller, rc, rc_plans)
+        self.dispatch.barrier()
+        return self.verify(plans)
+
+
+def run_program_buffered(program, runner, line_pause=3, on_line=None, on_line_end=None,
+                         on_step_done=None):
+    lines = []
+    for group in steps(program):
+        if lines and lines[-1][0].line == group[0].line:
+            lines[-1].extend(group)
+        else:
+            lines.append(list(group))
+
+    failures = 0
+    for moves in lines:
+        name = moves[0].line
+        print("Started " + name + " Longitudinal Line (buffered)")
+        if on_line is not None:
+            on_line(moves)
+        problems = runner.run_line(moves)
+        for p in problems:
+            if "message" in p:
+                print(f"[WARNING] Motor {p['tendon']} steps {p['steps']}: {p['message']}")
+            else:
+                print(f"[WARNING] Motor {p['tendon']} steps {p['steps']}: expected "
+                      f"{p['expected']} counts, encoder trace shows {p['actual']}")
+        failures += len(problems)
+        if on_step_done is not None:
+            on_step_done(moves)
+        if on_line_end is not None:
+            on_line_end(name)
+        print("Finished " + name + " Longitudinal Line")
+        time.sleep(line_pause)
+    if failures:
+        print(f"[ERROR] Post-hoc check found {failures} mismatched spans")
+    return failures
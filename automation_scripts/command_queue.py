@@ -0,0 +1,100 @@
+"""
+REACH manipulator manual command queue
+
+Controller callbacks run on the xbox360controller event thread and must
+return at once, or presses made while a move is verified and waited on
+are delayed or lost. Callbacks therefore only push a move intent into a
+bounded queue, and a motion worker thread executes the intents one at a
+time.
+
+A press of the same tendon in the same direction as the newest waiting
+intent is merged into it, so repeated presses become one larger move
+(up to max_distance counts) instead of a backlog of small ones. When the
+queue is full, new intents are dropped with a message. The queue depth
+is printed whenever it changes.
+
+Usage:
+    jog = CommandQueue(lambda tendon, distance: move_tendon(tendon, distance).result())
+    controller.button_y.when_pressed = lambda button: jog.push(1, motmov)
+    ...
+    jog.join()      # wait until every queued intent has run
+"""
+
+import threading
+from collections import deque
+
+
+class CommandQueue:
+    def __init__(self, execute, maxsize=8, max_distance=None):
+        self.execute = execute
+        self.maxsize = maxsize
+        self.max_distance = max_distance
+        # Waiting intents, [tendon, distance, presses]
+        self.pending = deque()
+        self.running = None
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name="jog")
+        self._thread.start()
+
+    def depth(self):
+        with self.cond:
+            return len(self.pending) + (self.running is not None)
+
+    def _describe(self, tendon, distance, presses):
+        return "Motor %d %s x%d" % (tendon, "Plus" if distance > 0 else "Minus", presses)
+
+    # Called from input callbacks, never blocks
+    def push(self, tendon, distance):
+        with self.cond:
+            if self.closed:
+                return False
+            last = self.pending[-1] if self.pending else None
+            if (last is not None and last[0] == tendon and (last[1] > 0) == (distance > 0)
+                    and (self.max_distance is None or abs(last[1] + distance) <= self.max_distance)):
+                last[1] += distance
+                last[2] += 1
+                intent = last
+            elif len(self.pending) >= self.maxsize:
+                self.dropped += 1
+                print(f"[QUEUE] Full ({self.maxsize}), dropped Motor {tendon} press")
+                return False
+            else:
+                intent = [tendon, distance, 1]
+                self.pending.append(intent)
+                self.cond.notify()
+            depth = len(self.pending) + (self.running is not None)
+        print(f"[QUEUE] {self._describe(*intent)} queued, depth {depth}")
+        return True
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                self.running = self.pending.popleft()
+            tendon, distance, presses = self.running
+            try:
+                self.execute(tendon, distance)
+            except Exception as e:
+                print(f"[ERROR] {self._describe(tendon, distance, presses)} failed: {e}")
+            with self.cond:
+                self.running = None
+                depth = len(self.pending)
+                self.cond.notify_all()
+            print(f"[QUEUE] {self._describe(tendon, distance, presses)} done, depth {depth}")
+
+    # Wait until every intent pushed so far has been executed
+    def join(self):
+        with self.cond:
+            while self.pending or self.running is not None:
+                self.cond.wait()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.pending.clear()
+            self.cond.notify_all()
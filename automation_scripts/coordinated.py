@@ -0,0 +1,178 @@
+"""
+REACH manipulator coordinated tendon moves
+
+A coordinated move takes a vector of tendon deltas, e.g. {1: +11520,
+3: -11520}, and drives all of those motors at once so they start
+together and finish together. The largest delta runs at the full speed
+and acceleration; every other motor gets both scaled by its share of
+the largest delta, which gives every motor the same trapezoidal profile
+in time. The two channels of a controller are started with one
+SpeedAccelDistanceM1M2_2 packet, and the two controllers are released
+together from their dispatch workers.
+
+If a worker is still busy when the move starts, for example with a
+tension correction, the other controller does not wait for it beyond
+timeout: the start barrier breaks, nothing is sent and the whole vector
+is submitted again.
+
+After the move has completed, the encoder change of every motor is
+checked. Motors that did not move (less than encoder_threshold counts)
+are moved again with what remains of their delta, up to retries times.
+
+Usage:
+    mover = CoordinatedMover(tendons, controller_status, dispatch, spd, acc)
+    mover.move({1: motmov, 3: -motmov})
+"""
+
+import threading
+import time
+
+import profiling
+from motion import wait_for_completion
+from status import enc
+
+
+# Scaled (speed, accel) of every tendon so all deltas take the same time
+def scale(deltas, speed, accel):
+    longest = max(abs(d) for d in deltas.values())
+    scaled = {}
+    for tendon, distance in deltas.items():
+        share = abs(distance) / longest
+        scaled[tendon] = (max(1, int(round(speed*share))), max(1, int(round(accel*share))))
+    return scaled
+
+
+class CoordinatedMover:
+    def __init__(self, tendons, controller_status, dispatch, spd, acc,
+                 settle_time=0.25, timeout=10, stats=None, retries=3,
+                 encoder_threshold=50, on_encoder=None):
+        self.tendons = tendons
+        self.controller_status = controller_status
+        self.dispatch = dispatch
+        self.spd = spd
+        self.acc = acc
+        self.settle_time = settle_time
+        self.timeout = timeout
+        self.stats = stats
+        self.retries = retries
+        self.encoder_threshold = encoder_threshold
+        # on_encoder(tendon, count) once a move has settled, e.g. telemetry
+        self.on_encoder = on_encoder
+
+    def _send(self, rc, address, channels):
+        if 1 in channels and 2 in channels:
+            s1, a1, d1 = channels[1]
+            s2, a2, d2 = channels[2]
+            rc.SpeedAccelDistanceM1M2_2(address, a1, s1, d1, a2, s2, d2, 1)
+        elif 1 in channels:
+            s1, a1, d1 = channels[1]
+            rc.SpeedAccelDistanceM1(address, a1, s1, d1, 1)
+        else:
+            s2, a2, d2 = channels[2]
+            rc.SpeedAccelDistanceM2(address, a2, s2, d2, 1)
+
+    # Move, wait and measure on the worker of one controller. Returns
+    # ({tendon: encoder change}, time waited, completed), or None when
+    # the other controllers did not reach the start in time.
+    def _run(self, rc, part, start):
+        status = self.controller_status[rc]
+        address = self.tendons[next(iter(part))][1]
+        before = status.encoders()
+
+        channels = {}
+        for tendon, (speed, accel, distance) in part.items():
+            motor = self.tendons[tendon][2]
+            channels[motor] = (speed, accel, distance)
+
+        with profiling.move(tuple(sorted(part)), [part[t][2] for t in sorted(part)]):
+            profiling.attempt()
+            try:
+                start.wait(self.timeout)
+            except threading.BrokenBarrierError:
+                return None
+            self._send(rc, address, channels)
+            status.invalidate()
+            sent = time.monotonic()
+            with profiling.phase("wait"):
+                completed = True
+                for motor in channels:
+                    done, _ = wait_for_completion(status, motor, settle_time=0,
+                                                  timeout=self.timeout)
+                    completed = completed and done
+                time.sleep(self.settle_time)
+            waited = time.monotonic() - sent
+            after = status.encoders()
+
+        moved = {}
+        for tendon in part:
+            motor = self.tendons[tendon][2]
+            moved[tendon] = enc(after, motor) - enc(before, motor)
+            if self.on_encoder is not None:
+                self.on_encoder(tendon, enc(after, motor))
+        return moved, waited, completed
+
+    # Start every tendon in deltas together and wait until all are done.
+    # Returns {tendon: encoder change} and {tendon: expected change}.
+    def _move_once(self, deltas):
+        scaled = scale(deltas, self.acc, self.spd)
+        parts = {}
+        expected = {}
+        for tendon, distance in deltas.items():
+            rc, address, motor, sign = self.tendons[tendon]
+            speed, accel = scaled[tendon]
+            speed = sign*speed if distance > 0 else -sign*speed
+            parts.setdefault(rc, {})[tendon] = (speed, accel, abs(distance))
+            expected[tendon] = abs(distance) if speed > 0 else -abs(distance)
+
+        for attempt in range(self.retries + 1):
+            start = threading.Barrier(len(parts))
+            futures = [self.dispatch.submit(rc, self._run, rc, part, start)
+                       for rc, part in parts.items()]
+            self.dispatch.barrier()
+            results = [future.result() for future in futures]
+            if None not in results:
+                break
+            # A broken barrier releases every controller before it sends
+            print(f"[WARNING] Controllers not ready together for {sorted(deltas)}, "
+                  f"submitting the move again")
+        else:
+            print(f"[ERROR] Controllers never ready together for {sorted(deltas)}")
+            return {t: 0 for t in deltas}, expected
+
+        moved = {}
+        for part_moved, waited, completed in results:
+            moved.update(part_moved)
+        if self.stats is not None:
+            # One wait for the whole vector, against the fixed dwell of each move in it
+            self.stats.add(max(r[1] for r in results), all(r[2] for r in results),
+                           moves=len(deltas))
+        return moved, expected
+
+    # Drive every tendon in deltas (tendon -> counts, positive tightens)
+    # together. Returns {tendon: encoder change}.
+    def move(self, deltas):
+        deltas = {t: d for t, d in deltas.items() if d}
+        if not deltas:
+            return {}
+        names = ", ".join("Motor %d %s" % (t, "Plus" if d > 0 else "Minus")
+                          for t, d in sorted(deltas.items()))
+
+        moved, expected = self._move_once(deltas)
+        for attempt in range(1, self.retries + 1):
+            stalled = [t for t in moved if abs(moved[t]) < self.encoder_threshold]
+            if not stalled:
+                print(f"[OK] {names} moved together. Encoder change: {moved}")
+                return moved
+            print(f"[WARNING] Motors {stalled} failed attempt {attempt} of {names}: {moved}")
+            # Move the stalled motors again by what is left of their delta
+            remaining = {t: (expected[t] - moved[t])*self.tendons[t][3] for t in stalled}
+            retried, _ = self._move_once(remaining)
+            for t, m in retried.items():
+                moved[t] += m
+
+        stalled = [t for t in moved if abs(moved[t]) < self.encoder_threshold]
+        if stalled:
+            print(f"[ERROR] Motors {stalled} failed to move after {self.retries} attempts")
+        else:
+            print(f"[OK] {names} moved after retries. Encoder change: {moved}")
+        return moved
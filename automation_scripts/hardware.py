@@ -0,0 +1,189 @@
+"""
+REACH manipulator hardware profile
+
+The serial ports, baud rates, Roboclaw addresses, tendon wiring, motion
+speeds and load cell calibration of a rig live in one JSON profile
+(hardware_profile.json next to this file, or the file named by
+REACH_PROFILE), read by every entry point. Switching rigs or
+recalibrating means editing that file only.
+
+connect() opens the controllers. A controller is kept on its configured
+port if it answers the version command at its address there. Otherwise,
+with autodetect on, every serial port is probed until one answers at
+that address. Baud rates are tried fastest first, so each link runs at
+the fastest rate the hardware answers on.
+
+With the watchdog section of the profile enabled, every controller is
+wrapped in a link.WatchedRoboclaw, which reconnects it the same way when
+its link drops mid-run. rig.report_links() prints the link health.
+
+Usage:
+    profile = hardware.load_profile()
+    rig = hardware.connect(profile)
+    rc1, add1 = rig.controller('rc1')
+    rig.tendons     # tendon -> (Roboclaw, address, channel, sign that tightens)
+"""
+
+import copy
+import glob
+import json
+import os
+
+from link import WatchedRoboclaw
+
+DEFAULT_PROFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hardware_profile.json')
+
+
+def load_profile(path=None):
+    path = path or os.environ.get("REACH_PROFILE") or DEFAULT_PROFILE
+    with open(path) as f:
+        profile = json.load(f)
+    profile["path"] = path
+    for controller in profile["controllers"].values():
+        controller["address"] = int(str(controller["address"]), 0)
+    profile["tendons"] = {int(t): w for t, w in profile["tendons"].items()}
+    return profile
+
+
+def candidate_ports():
+    return sorted(glob.glob('/dev/ttyACM*') + glob.glob('/dev/ttyUSB*'))
+
+
+# Close the serial port of a Roboclaw, if it has one open
+def _close(rc):
+    port = getattr(rc, "_port", None)
+    if port is not None:
+        try:
+            port.close()
+        except Exception:
+            pass
+
+
+# Open port at the fastest listed baud that answers ReadVersion at
+# address. Returns (Roboclaw, baud, version) or None.
+def probe(port, address, baudrates):
+    from roboclaw_3 import Roboclaw
+    for baud in sorted(baudrates, reverse=True):
+        rc = Roboclaw(port, baud)
+        ok = False
+        try:
+            if rc.Open():
+                ok, version = rc.ReadVersion(address)
+        except Exception:
+            ok = False
+        finally:
+            # The next baud rate opens the port again
+            if not ok:
+                _close(rc)
+        if ok:
+            return rc, baud, version.strip()
+    return None
+
+
+class Rig:
+    def __init__(self, profile):
+        self.profile = profile
+        # name -> (Roboclaw, address, port, baud)
+        self.controllers = {}
+        self.tendons = {}
+
+    def controller(self, name):
+        rc, address, port, baud = self.controllers[name]
+        return rc, address
+
+    @property
+    def spd(self):
+        return self.profile["motion"]["spd"]
+
+    @property
+    def acc(self):
+        return self.profile["motion"]["acc"]
+
+    @property
+    def motmov(self):
+        return self.profile["motion"]["motmov"]
+
+    def health(self):
+        return {name: c[0].health.summary() for name, c in self.controllers.items()
+                if isinstance(c[0], WatchedRoboclaw)}
+
+    def report_links(self):
+        for rc, address, port, baud in self.controllers.values():
+            if isinstance(rc, WatchedRoboclaw):
+                rc.report()
+
+    @property
+    def gains(self):
+        return list(self.profile["load_cells"]["gains"])
+
+    @property
+    def offsets(self):
+        return list(self.profile["load_cells"]["offsets"])
+
+    # Tendon measured by each load cell
+    @property
+    def load_cell_tendons(self):
+        return list(self.profile["load_cells"].get("tendons", [1, 2, 3, 4]))
+
+    # Highest force the automatic adjustments may leave on a tendon
+    @property
+    def max_force(self):
+        return self.profile["load_cells"].get("max_force")
+
+
+# reopen(rc) for a WatchedRoboclaw: the same port first, then with
+# autodetect every port no other controller of the rig is using
+def _reopener(rig, address, baudrates, autodetect):
+    def reopen(rc):
+        ports = [rc.comport]
+        if autodetect:
+            used = {c[0].comport for c in rig.controllers.values() if getattr(c[0], "rc", c[0]) is not rc}
+            ports += [p for p in candidate_ports() if p != rc.comport and p not in used]
+        for port in ports:
+            for baud in sorted(baudrates, reverse=True):
+                _close(rc)
+                rc.comport, rc.rate = port, baud
+                try:
+                    if rc.Open() and rc.ReadVersion(address)[0]:
+                        return port
+                except Exception:
+                    continue
+        return None
+    return reopen
+
+
+def connect(profile=None):
+    profile = copy.deepcopy(profile) if profile is not None else load_profile()
+    rig = Rig(profile)
+    baudrates = profile.get("baudrates", [230400])
+    taken = set()
+    for name, conf in profile["controllers"].items():
+        port, address = conf["port"], conf["address"]
+        found = probe(port, address, baudrates)
+        if found is None and profile.get("autodetect", True):
+            for other in candidate_ports():
+                if other == port or other in taken:
+                    continue
+                found = probe(other, address, baudrates)
+                if found is not None:
+                    print(f"[HARDWARE] {name} ({hex(address)}) found on {other} instead of {port}")
+                    port = other
+                    break
+        if found is None:
+            raise RuntimeError("Roboclaw %s (address %s) does not answer on %s or any other port"
+                               % (name, hex(address), conf["port"]))
+        rc, baud, version = found
+        taken.add(port)
+        watchdog = profile.get("watchdog", {})
+        if watchdog.get("enabled", False):
+            settings = {k: v for k, v in watchdog.items() if k != "enabled"}
+            rc = WatchedRoboclaw(rc, address, _reopener(rig, address, baudrates,
+                                                        profile.get("autodetect", True)),
+                                 name=name, **settings)
+        rig.controllers[name] = (rc, address, port, baud)
+        print(f"[HARDWARE] {name}: {version} on {port} at {baud} baud, address {hex(address)}")
+
+    for tendon, wiring in profile["tendons"].items():
+        rc, address, port, baud = rig.controllers[wiring["controller"]]
+        rig.tendons[tendon] = (rc, address, wiring["channel"], wiring["tighten"])
+    return rig
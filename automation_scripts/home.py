@@ -0,0 +1,86 @@
+"""
+REACH manipulator upright home pose
+
+The encoder counts of the manually aligned upright pose are captured
+once, when the run starts, and written to a small JSON file. Moves to
+the pose use the Roboclaw absolute position commands
+(SpeedAccelDeccelPositionM1/M2), so returning upright is one move per
+motor to a known count instead of replaying the inverse of a line step
+by step, and relative errors do not build up from line to line.
+
+Encoder counts only hold while the controllers stay powered; a pose
+saved before a power cycle no longer matches the rig.
+
+Usage:
+    home = capture(tendons, controller_status)
+    save(home_file, home)
+    move_to(home, tendons, controller_status, dispatch, accel=spd, speed=acc)
+"""
+
+import json
+import time
+
+from motion import wait_for_completion
+from status import enc
+
+
+# Encoder count of every tendon motor, {tendon: count}
+def capture(tendons, controller_status):
+    pose = {}
+    for tendon, (rc, address, motor, sign) in sorted(tendons.items()):
+        status = controller_status[rc]
+        pose[tendon] = enc(status.encoders(), motor)
+    return pose
+
+
+def save(path, pose):
+    with open(path, 'w') as f:
+        json.dump({"captured": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "encoders": {str(t): c for t, c in pose.items()}}, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    return {int(t): c for t, c in data["encoders"].items()}
+
+
+def position_command(rc, address, motor, accel, speed, deccel, position, buffer=1):
+    if motor == 1:
+        return rc.SpeedAccelDeccelPositionM1(address, accel, speed, deccel, position, buffer)
+    return rc.SpeedAccelDeccelPositionM2(address, accel, speed, deccel, position, buffer)
+
+
+# Drive every tendon in pose to its absolute encoder count. Both motors of
+# a controller are started together on its worker, then waited on.
+# Returns {tendon: final count}.
+def move_to(pose, tendons, controller_status, dispatch, accel, speed, deccel=None,
+            settle_time=0.25, timeout=30, stats=None):
+    deccel = accel if deccel is None else deccel
+    by_controller = {}
+    for tendon, target in pose.items():
+        rc, address, motor, sign = tendons[tendon]
+        by_controller.setdefault(rc, []).append((tendon, address, motor, target))
+
+    def run(rc, targets):
+        status = controller_status[rc]
+        for tendon, address, motor, target in targets:
+            position_command(rc, address, motor, accel, speed, deccel, target)
+        status.invalidate()
+        for tendon, address, motor, target in targets:
+            wait_for_completion(status, motor, settle_time=settle_time,
+                                timeout=timeout, stats=stats)
+        snap = status.encoders()
+        return {tendon: enc(snap, motor) for tendon, address, motor, target in targets}
+
+    futures = [dispatch.submit(rc, run, rc, targets) for rc, targets in by_controller.items()]
+    dispatch.barrier()
+    reached = {}
+    for future in futures:
+        reached.update(future.result())
+    return reached
+
+
+# Largest distance of any tendon from the pose, in counts
+def error(pose, reached):
+    return max(abs(reached[t] - pose[t]) for t in pose)
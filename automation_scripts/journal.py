@@ -0,0 +1,229 @@
+"""
+REACH manipulator run journal
+
+Every completed step of a workspace run is appended to a JSON lines
+file as soon as it finishes, with the moves it made (motor, direction,
+distance) and the encoder count of each motor before and after. The
+file is flushed and synced after every step, so it survives a serial
+hiccup, a Phidget detach or Ctrl-C.
+
+Before a step is sent, its target pose (the encoders before it plus
+its moves) is written too. A step interrupted by Ctrl-C keeps running
+on the controllers and is never committed, so the rig usually ends up
+at that target rather than where the last completed step left it.
+Coordinated moves send a step as several vectors, and an interruption
+between two of them would leave the rig at neither pose, so after
+hold_interrupts() the first Ctrl-C during a step only stops the run
+once the step has finished and been committed. A second Ctrl-C stops
+it at once.
+
+Tension corrections move tendons outside the steps. Each one is
+journaled once it has landed, with the encoder count it left and the
+change it made, and both the last committed pose and the target of a
+step in flight are shifted by it.
+
+A run started with --resume reloads the journal and checks that the
+compiled sequence is the same one. The encoders must read either what
+the last completed step left behind or the target of the step that was
+in flight; in the second case that step is committed as recovered. The
+run then continues from the step after it instead of from the first
+line.
+
+Usage:
+    journal = RunJournal(journal_file, encoders=read_encoders, tendons=tendons)
+    journal.start(program, home_pose)
+    journal.hold_interrupts()
+    run_program(..., on_step=journal.begin, on_step_done=journal.commit)
+    TensionRegulator(..., on_correction=journal.correction)
+
+    state = load(journal_file)
+    check(state, program, current_encoders)
+    program = remaining(program, state)
+    journal.reopen(state)
+"""
+
+import hashlib
+import json
+import os
+import signal
+import threading
+import time
+
+
+# Short hash of a compiled program, a resumed run must match it
+def fingerprint(program):
+    text = json.dumps([list(m) for m in program])
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+class RunJournal:
+    # encoders() returns {tendon: count}, called between steps. tendons
+    # gives the sign that tightens each motor, for the step targets.
+    def __init__(self, path, encoders, tendons):
+        self.path = path
+        self.encoders = encoders
+        self.tendons = tendons
+        self._file = None
+        self._before = None
+        # Steps begun and not yet committed, and a Ctrl-C held back for them
+        self._open = set()
+        self._interrupted = False
+        # Corrections are written from the dispatch workers
+        self._lock = threading.Lock()
+
+    # Ctrl-C during a step raises KeyboardInterrupt from commit() once the
+    # step is done. Call from the main thread.
+    def hold_interrupts(self):
+        signal.signal(signal.SIGINT, self._sigint)
+
+    def _sigint(self, signum, frame):
+        if not self._open or self._interrupted:
+            raise KeyboardInterrupt
+        self._interrupted = True
+        print("Stopping after the current step, Ctrl-C again to stop now")
+
+    def _write(self, record):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def start(self, program, home_pose=None):
+        self._file = open(self.path, 'w')
+        self._write({"type": "run", "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+                     "program": fingerprint(program), "moves": len(program),
+                     "home": {str(t): c for t, c in (home_pose or {}).items()}})
+
+    # Continue an existing journal after a resume, committing the step
+    # check() found had completed after the interruption
+    def reopen(self, state=None):
+        self._file = open(self.path, 'a')
+        self._write({"type": "resume", "time": time.strftime("%Y-%m-%d %H:%M:%S")})
+        recovered = state and state.get("recovered")
+        if recovered:
+            self._write({"type": "step", "line": recovered["line"], "steps": recovered["steps"],
+                         "time": time.time(), "recovered": True,
+                         "encoders": {str(t): c for t, c in recovered["target"].items()}})
+
+    # Call before the moves of a step (or line) are sent
+    def begin(self, moves):
+        self._before = self.encoders()
+        self._open = {m.step for m in moves}
+        target = dict(self._before)
+        for m in moves:
+            target[m.tendon] += m.distance*self.tendons[m.tendon][3]
+        self._write({"type": "begin", "line": moves[0].line,
+                     "steps": sorted({m.step for m in moves}), "time": time.time(),
+                     "target": {str(t): c for t, c in target.items()}})
+
+    # Call once the moves have completed on both controllers
+    def commit(self, moves):
+        after = self.encoders()
+        before = self._before or after
+        self._write({
+            "type": "step",
+            "line": moves[0].line,
+            "steps": sorted({m.step for m in moves}),
+            "time": time.time(),
+            "moves": [{"motor": m.tendon,
+                       "direction": "+" if m.distance > 0 else "-",
+                       "distance": abs(m.distance),
+                       "enc_before": before[m.tendon],
+                       "enc_after": after[m.tendon]} for m in moves],
+            "encoders": {str(t): c for t, c in after.items()},
+        })
+        self._before = None
+        self._open -= {m.step for m in moves}
+        if self._interrupted and not self._open:
+            self._interrupted = False
+            raise KeyboardInterrupt
+
+    # Call after a tension correction has landed on tendon
+    def correction(self, tendon, change, count):
+        self._write({"type": "correction", "tendon": tendon, "change": change,
+                     "encoder": count, "time": time.time()})
+
+    # Call after a move to the home pose
+    def home(self, pose):
+        self._write({"type": "home", "time": time.time(),
+                     "encoders": {str(t): c for t, c in pose.items()}})
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# Reload a journal. Returns a dict with the program fingerprint, the home
+# pose, the last completed step (-1 if none), the encoder counts it left
+# behind and the step begun after it, if any ("pending").
+def load(path):
+    state = {"program": None, "home": {}, "last_step": -1, "encoders": None, "steps": 0,
+             "pending": None}
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A record cut short by the crash, everything before it holds
+                break
+            if record["type"] == "run":
+                state["program"] = record["program"]
+                state["home"] = {int(t): c for t, c in record["home"].items()}
+            elif record["type"] == "begin":
+                state["pending"] = {"line": record["line"], "steps": record["steps"],
+                                    "target": {int(t): c for t, c in record["target"].items()}}
+            elif record["type"] == "step":
+                state["last_step"] = max(record["steps"])
+                state["encoders"] = {int(t): c for t, c in record["encoders"].items()}
+                state["steps"] += 1
+                pending = state["pending"]
+                if pending is not None and max(pending["steps"]) <= state["last_step"]:
+                    state["pending"] = None
+            elif record["type"] == "correction":
+                tendon = record["tendon"]
+                if state["encoders"] is not None:
+                    state["encoders"][tendon] = record["encoder"]
+                if state["pending"] is not None:
+                    state["pending"]["target"][tendon] += record["change"]
+            elif record["type"] == "home":
+                state["encoders"] = {int(t): c for t, c in record["encoders"].items()}
+    return state
+
+
+def _mismatches(expected, encoders, tolerance):
+    return [(t, c) for t, c in expected.items() if abs(encoders[t] - c) > tolerance]
+
+
+# Problems that rule out resuming, empty if the run can continue. When
+# the encoders read the target of the step in flight, that step is taken
+# as completed: state is updated and state["recovered"] set.
+def check(state, program, encoders, tolerance=200):
+    problems = []
+    if state["program"] != fingerprint(program):
+        problems.append("the compiled sequence differs from the journaled run")
+    if state["encoders"] is None:
+        return problems
+    mismatched = _mismatches(state["encoders"], encoders, tolerance)
+    pending = state["pending"]
+    if mismatched and pending is not None and not _mismatches(pending["target"], encoders, tolerance):
+        print(f"Step {max(pending['steps'])} finished after the interruption, taking it as completed")
+        state["recovered"] = pending
+        state["last_step"] = max(pending["steps"])
+        state["encoders"] = pending["target"]
+        state["pending"] = None
+        return problems
+    for tendon, count in mismatched:
+        line = "motor %d reads %d counts, journal expects %d" % (tendon, encoders[tendon], count)
+        if pending is not None:
+            line += " (or %d after step %d)" % (pending["target"][tendon], max(pending["steps"]))
+        problems.append(line)
+    return problems
+
+
+# The moves after the last completed step
+def remaining(program, state):
+    return [m for m in program if m.step > state["last_step"]]
@@ -0,0 +1,214 @@
+"""
+REACH manipulator serial link watchdog
+
+A USB hiccup on /dev/ttyACM0 or /dev/ttyACM1 makes roboclaw_3 calls
+raise, or return failure tuples that the callers unpack as encoder
+counts of zero. WatchedRoboclaw wraps a Roboclaw and goes through every
+call on its way to the controller:
+
+  - each transaction is timed and counted, per port, as a success or a
+    failure (an exception, False, or a tuple whose first item is 0);
+    one that takes longer than stall_time is reported as a stall
+  - after max_failures failures in a row, or any exception, the port
+    is closed and opened again. If the controller no longer answers
+    there, the other serial ports are searched for its address, as the
+    port can come back under a new name
+  - after a reconnect the encoders are read again. A controller that
+    lost power comes back with its encoders near zero; they are set
+    back to the last counts read before the drop, so the rig keeps its
+    pose. Listeners in on_reconnect (the ControllerStatus caches) are
+    told their state is stale
+  - a failed read is retried (after a reconnect where one is due) and
+    never handed to the caller; after reconnect_attempts the call
+    raises LinkError. A failed motion command is returned as it is,
+    without a resend that could double a relative move, and the move
+    verification of the caller deals with it
+
+health() and report() give the counters: transactions, success rate,
+latency, stalls, reconnects and encoder re-syncs.
+
+Usage:
+    rc = WatchedRoboclaw(Roboclaw(port, baud), address, reopen)
+    rc.ReadEncoders(address)        # same interface as Roboclaw
+    rc.report()
+"""
+
+import threading
+import time
+from collections import deque
+
+from status import to_signed32
+
+
+class LinkError(IOError):
+    pass
+
+
+class LinkHealth:
+    def __init__(self, history=1000):
+        self.transactions = 0
+        self.failures = 0
+        self.exceptions = 0
+        self.stalls = 0
+        self.reconnects = 0
+        self.resyncs = 0
+        self.latencies = deque(maxlen=history)
+
+    def success_rate(self):
+        if not self.transactions:
+            return 1.0
+        return 1.0 - self.failures / self.transactions
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        p95 = latencies[int(0.95*(len(latencies) - 1))] if latencies else 0.0
+        return {"transactions": self.transactions, "failures": self.failures,
+                "exceptions": self.exceptions, "success_rate": round(self.success_rate(), 5),
+                "latency_mean_ms": round(1000*sum(latencies) / len(latencies), 3) if latencies else 0.0,
+                "latency_p95_ms": round(1000*p95, 3),
+                "latency_max_ms": round(1000*latencies[-1], 3) if latencies else 0.0,
+                "stalls": self.stalls, "reconnects": self.reconnects, "resyncs": self.resyncs}
+
+
+def _succeeded(result):
+    if isinstance(result, tuple):
+        return bool(result and result[0])
+    if isinstance(result, bool):
+        return result
+    return True
+
+
+class WatchedRoboclaw:
+    # reopen(rc) opens the link of rc again and returns the port it is on,
+    # or None while the controller cannot be found
+    def __init__(self, rc, address, reopen, name=None, stall_time=0.5, max_failures=3,
+                 reconnect_attempts=5, reconnect_delay=1.0, resync_tolerance=2000):
+        self.rc = rc
+        self.address = address
+        self.reopen = reopen
+        self.name = name or rc.comport
+        self.stall_time = stall_time
+        self.max_failures = max_failures
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.resync_tolerance = resync_tolerance
+        self.health = LinkHealth()
+        # Called with no arguments after every reconnect
+        self.on_reconnect = []
+        # Last encoder counts read, per channel
+        self.encoders = {}
+        self.in_a_row = 0
+        self.lock = threading.RLock()
+
+    @property
+    def comport(self):
+        return self.rc.comport
+
+    def __getattr__(self, name):
+        attr = getattr(self.rc, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._call(name, args, kwargs)
+        return call
+
+    def _once(self, name, args, kwargs):
+        start = time.perf_counter()
+        error = None
+        try:
+            result = getattr(self.rc, name)(*args, **kwargs)
+            ok = _succeeded(result)
+        except Exception as e:
+            result, ok, error = None, False, e
+        latency = time.perf_counter() - start
+
+        health = self.health
+        health.transactions += 1
+        health.latencies.append(latency)
+        if latency > self.stall_time:
+            health.stalls += 1
+            print(f"[LINK] {self.name} {name} stalled for {latency:.2f} s")
+        if ok:
+            self.in_a_row = 0
+            self._track(name, result)
+        else:
+            health.failures += 1
+            self.in_a_row += 1
+            if error is not None:
+                health.exceptions += 1
+        return result, ok, error
+
+    # Remember the encoder counts every read returns
+    def _track(self, name, result):
+        if name == "ReadEncoders":
+            self.encoders[1], self.encoders[2] = to_signed32(result[1]), to_signed32(result[2])
+        elif name in ("ReadEncM1", "ReadEncM2"):
+            self.encoders[int(name[-1])] = to_signed32(result[1])
+
+    def _call(self, name, args, kwargs):
+        reading = name.startswith("Read")
+        attempts = 0
+        with self.lock:
+            while True:
+                result, ok, error = self._once(name, args, kwargs)
+                if ok:
+                    return result
+                if error is None and self.in_a_row < self.max_failures:
+                    # A lost packet, read again but leave motion to the caller
+                    if reading:
+                        continue
+                    return result
+                if attempts == self.reconnect_attempts:
+                    raise LinkError("%s %s failed after %d reconnect attempts: %s"
+                                    % (self.name, name, attempts, error or result))
+                attempts += 1
+                self.reconnect(error)
+                if not reading:
+                    return result
+
+    def reconnect(self, error=None):
+        with self.lock:
+            cause = error if error is not None else "%d failures in a row" % self.in_a_row
+            print(f"[LINK] {self.name} on {self.rc.comport} lost ({cause}), reconnecting")
+            port = self.reopen(self.rc)
+            if port is None:
+                time.sleep(self.reconnect_delay)
+                return False
+            self.health.reconnects += 1
+            self.in_a_row = 0
+            print(f"[LINK] {self.name} reconnected on {port}")
+            try:
+                self.resync()
+            except Exception as e:
+                print(f"[LINK] {self.name} encoder re-sync failed: {e}")
+            for listener in self.on_reconnect:
+                listener()
+            return True
+
+    # Restore the encoders of a controller that came back reset
+    def resync(self):
+        ok, enc1, enc2 = self.rc.ReadEncoders(self.address)
+        if not ok or not self.encoders:
+            return
+        counts = {1: to_signed32(enc1), 2: to_signed32(enc2)}
+        for motor, last in self.encoders.items():
+            # Only a reading near zero where the last one was not is a reset;
+            # anything else is the motor having moved since the last read
+            if abs(counts[motor]) <= self.resync_tolerance < abs(last):
+                print(f"[LINK] {self.name} M{motor} encoder read {counts[motor]} after the "
+                      f"reconnect, restoring {last}")
+                if motor == 1:
+                    self.rc.SetEncM1(self.address, last)
+                else:
+                    self.rc.SetEncM2(self.address, last)
+                self.health.resyncs += 1
+            else:
+                self.encoders[motor] = counts[motor]
+
+    def report(self):
+        h = self.health.summary()
+        print(f"[LINK] {self.name}: {h['transactions']} transactions, "
+              f"{100*h['success_rate']:.2f}% ok, latency {h['latency_mean_ms']:.2f} ms mean "
+              f"{h['latency_p95_ms']:.2f} ms p95 {h['latency_max_ms']:.2f} ms max, "
+              f"{h['stalls']} stalls, {h['reconnects']} reconnects, {h['resyncs']} re-syncs")
@@ -0,0 +1,231 @@
+"""
+REACH manipulator load cell acquisition
+
+Long-lived session for the four inline load cells. The Phidget
+VoltageRatioInput channels are opened once at startup and stream for
+the whole run, so a move only costs the motor time instead of
+re-registering handlers and re-attaching every channel afterwards.
+
+Usage:
+    session = LoadCellSession(gains, offsets, on_row=log_row,
+                              data_interval=8)
+    session.open()
+    session.start()
+    ...
+    session.mark_step()     # tag following samples with the next step id
+    session.forces()        # latest force of every channel
+    ...
+    session.stop()
+    session.close()
+
+Two callbacks are available, both called from the Phidget event threads
+while the session is started:
+
+on_sample(timestamp, step, channel, force)
+    Every raw sample of every channel.
+on_row(timestamp, step, forces)
+    One dense row per tick of a common sample clock with all four
+    calibrated forces. All channels are set to the same data interval
+    and their samples are binned onto ticks of that interval; a channel
+    that missed a tick repeats its last value. Rows start once every
+    channel has reported, and carry the step of the last sample of
+    their tick.
+
+Timestamps are seconds from start() on the monotonic clock.
+
+data_interval, change_trigger and bridge_gain take one value for every
+channel or a list with one per channel. data_interval 'max' runs every
+channel at the fastest interval its bridge supports, and a
+change_trigger of 0 reports every sample instead of only changes. Rows are aligned on the shortest
+interval. measure_rates() counts the samples that actually arrive, so
+the effective rate can be reported at startup.
+"""
+
+import threading
+import time
+from Phidget22.Phidget import *
+from Phidget22.Devices.VoltageRatioInput import *
+
+
+class SampleAligner:
+    def __init__(self, n_channels, interval, on_row):
+        self.n_channels = n_channels
+        self.interval = interval
+        self.on_row = on_row
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.tick = None
+        self.step = None
+        self.latest = [None] * self.n_channels
+        self.seen = [False] * self.n_channels
+        self.emitted = True
+
+    def add(self, timestamp, step, channel, force):
+        tick = int(timestamp / self.interval)
+        with self.lock:
+            if self.tick is None or tick > self.tick:
+                # A new tick started, finish the previous one if it is still open
+                if not self.emitted:
+                    self._emit()
+                self.tick = tick
+                self.seen = [False] * self.n_channels
+                self.emitted = False
+            if tick == self.tick:
+                self.step = step
+            self.latest[channel] = force
+            self.seen[channel] = True
+            if not self.emitted and all(self.seen):
+                self._emit()
+
+    # Row of the open tick, with the step stored with it. Nothing is
+    # written until every channel has a value to repeat.
+    def _emit(self):
+        self.emitted = True
+        if None in self.latest:
+            return
+        self.on_row(self.tick * self.interval, self.step, list(self.latest))
+
+
+class LoadCellSession:
+    def __init__(self, gains, offsets, on_sample=None, on_row=None,
+                 channels=(0, 1, 2, 3), attach_timeout=5000, data_interval=None,
+                 change_trigger=None, bridge_gain=None, tendons=None):
+        self.gains = list(gains)
+        self.offsets = list(offsets)
+        self.on_sample = on_sample
+        self.on_row = on_row
+        self.channels = list(channels)
+        # Tendon measured by each channel, tendon i + 1 by default
+        self.tendons = list(tendons) if tendons is not None else [i + 1 for i in range(len(self.channels))]
+        self.attach_timeout = attach_timeout
+        # Data interval in ms, None runs every channel at the default of the first
+        self.data_interval = data_interval
+        self.change_trigger = change_trigger
+        self.bridge_gain = bridge_gain
+        # Interval of every channel once open
+        self.intervals = []
+
+        self.inputs = []
+        self.aligner = None
+        self.recording = False
+        # Last calibrated force of every channel, also while not recording
+        self.latest = [None] * len(self.channels)
+        # Samples received per channel since counting started
+        self.counts = [0] * len(self.channels)
+        self.count_start = time.monotonic()
+        self.step = 0
+        self.step_lock = threading.Lock()
+        self.t0 = time.monotonic()
+
+    def open(self):
+        if self.inputs:
+            return
+        for index, channel in enumerate(self.channels):
+            vri = VoltageRatioInput()
+            vri.setChannel(channel)
+            # Assign the handler before open so that no events are missed
+            vri.setOnVoltageRatioChangeHandler(self._make_handler(index))
+            vri.openWaitForAttachment(self.attach_timeout)
+            self.inputs.append(vri)
+
+        # Without an interval every channel runs on the default of the
+        # first, so they share one clock
+        if self.data_interval is None:
+            self.data_interval = self.inputs[0].getDataInterval()
+        intervals = self._per_channel(self.data_interval)
+        triggers = self._per_channel(self.change_trigger)
+        gains = self._per_channel(self.bridge_gain)
+        for vri, interval, trigger, gain in zip(self.inputs, intervals, triggers, gains):
+            if gain is not None:
+                vri.setBridgeGain(gain)
+            if interval == 'max':
+                interval = vri.getMinDataInterval()
+            vri.setDataInterval(interval)
+            if trigger is not None:
+                vri.setVoltageRatioChangeTrigger(trigger)
+        self.intervals = [vri.getDataInterval() for vri in self.inputs]
+
+        if self.on_row is not None:
+            self.aligner = SampleAligner(len(self.inputs),
+                                         min(self.intervals) / 1000.0,
+                                         self.on_row)
+        self.reset_counts()
+
+    def _per_channel(self, value):
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        return [value] * len(self.channels)
+
+    def close(self):
+        self.recording = False
+        for vri in self.inputs:
+            vri.close()
+        self.inputs = []
+
+    def start(self):
+        if self.aligner is not None:
+            self.aligner.reset()
+        self.t0 = time.monotonic()
+        self.recording = True
+
+    def stop(self):
+        self.recording = False
+
+    # Samples after this call are tagged with the new step id
+    def mark_step(self, step=None):
+        # Moves on the two controllers can mark steps from different threads
+        with self.step_lock:
+            self.step = self.step + 1 if step is None else step
+            return self.step
+
+    def reset_counts(self):
+        self.counts = [0] * len(self.channels)
+        self.count_start = time.monotonic()
+
+    # Samples per second of every channel since the counts were reset
+    def rates(self):
+        elapsed = time.monotonic() - self.count_start
+        return [count / elapsed if elapsed > 0 else 0.0 for count in self.counts]
+
+    # Count samples for duration seconds and return the rate of every channel
+    def measure_rates(self, duration=1.0):
+        self.reset_counts()
+        time.sleep(duration)
+        return self.rates()
+
+    def report(self, rates):
+        for index, channel in enumerate(self.channels):
+            trigger = self.inputs[index].getVoltageRatioChangeTrigger() if self.inputs else None
+            print(f"[LOADCELL] Channel {channel}: interval {self.intervals[index]} ms "
+                  f"({1000.0 / self.intervals[index]:.0f} Hz), change trigger {trigger}, "
+                  f"measured {rates[index]:.0f} samples/s")
+
+    # Latest force of every channel, None for a channel with no sample yet
+    def forces(self):
+        return list(self.latest)
+
+    def force(self, index, voltageRatio):
+        return voltageRatio*self.gains[index] - self.offsets[index]
+
+    def _make_handler(self, index):
+        def handler(vri, voltageRatio):
+            force = self.force(index, voltageRatio)
+            self.latest[index] = force
+            self.counts[index] += 1
+            if not self.recording:
+                return
+            timestamp = time.monotonic() - self.t0
+            if self.on_sample is not None:
+                self.on_sample(timestamp, self.step, index, force)
+            if self.aligner is not None:
+                self.aligner.add(timestamp, self.step, index, force)
+        return handler
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,120 @@
+"""
+REACH manipulator motion checks and completion
+
+check_motor_movement() sends a command and verifies that the motor
+started. wait_for_completion() then waits for the move to finish
+instead of sleeping a fixed time after every command: the controller
+reports the command buffer depth of each channel, and 0x80 means the
+buffer is empty and the last command has completed. The tendon is then
+given a short settle time before the next move.
+
+Both work on a status.ControllerStatus, so the reads use the combined
+both-motor commands and the encoder counts of a settled controller are
+reused instead of read again. A verified move costs two status packets
+(speeds and buffers) instead of four single-motor reads.
+
+DwellStats keeps track of how long the waits took compared with the
+fixed dwell they replace, so a run can report the time saved.
+"""
+
+import threading
+import time
+
+import profiling
+from status import buffer, enc, speed
+
+# ReadBuffers value for an empty buffer with no command executing
+BUFFER_IDLE = 0x80
+
+
+class DwellStats:
+    def __init__(self, fixed_dwell=3.0):
+        self.fixed_dwell = fixed_dwell
+        self.moves = 0
+        self.waited = 0.0
+        self.timeouts = 0
+        self.lock = threading.Lock()
+
+    # elapsed covers moves moves waited on together, e.g. a coordinated vector
+    def add(self, elapsed, completed=True, moves=1):
+        with self.lock:
+            self.moves += moves
+            self.waited += elapsed
+            if not completed:
+                self.timeouts += 1
+
+    def saved(self):
+        return self.moves*self.fixed_dwell - self.waited
+
+    def report(self):
+        print(f"[DWELL] {self.moves} moves, waited {self.waited:.1f} s instead of "
+              f"{self.moves*self.fixed_dwell:.1f} s, saved {self.saved():.1f} s "
+              f"({self.timeouts} timeouts)")
+
+
+# Send a command and check that the motor started. A motor that reports
+# a speed counts as moving; otherwise it has move_time to show an
+# encoder change of at least encoder_threshold counts.
+def check_motor_movement(status, motor, send_command_fn,
+                         settle_time=0.05, move_time=0.2, encoder_threshold=50):
+
+    # Encoder State before, cached while the controller is settled
+    enc_before = enc(status.encoders(), motor)
+
+    # Send command
+    send_command_fn()
+    status.invalidate()
+    profiling.sleep(settle_time)
+
+    # Speed and buffer of both motors
+    snap = status.read(encoders=False)
+    motor_speed = speed(snap, motor)
+    buf = buffer(snap, motor)
+
+    enc_after = None
+    encoder_delta = None
+    if motor_speed == 0:
+        # Not running (yet), look for encoder movement instead
+        profiling.sleep(move_time)
+        enc_after = enc(status.read(speeds=False, buffers=False), motor)
+        encoder_delta = abs(enc_after - enc_before)
+
+    # Check movement success
+    success = motor_speed != 0 or encoder_delta >= encoder_threshold
+
+    diagnostics = {
+        "enc_before": enc_before,
+        "enc_after": enc_after,
+        "encoder_delta": encoder_delta,
+        "buffer": buf,
+        "speed": motor_speed
+    }
+
+    return success, diagnostics
+
+
+# Poll the controller until the move on this channel is done, then wait
+# settle_time for the tendon tension to settle. Returns (completed, elapsed).
+def wait_for_completion(status, motor, settle_time=0.25, timeout=10.0,
+                        poll_interval=0.02, stats=None):
+    start = time.monotonic()
+    completed = True
+    while True:
+        snap = status.read(encoders=False, speeds=False)
+        if buffer(snap, motor) == BUFFER_IDLE:
+            break
+        if time.monotonic() - start > timeout:
+            print(f"[WARNING] Motor channel M{motor} at {hex(status.address)} still moving "
+                  f"after {timeout} s (buffer {buffer(snap, motor)})")
+            completed = False
+            break
+        time.sleep(poll_interval)
+
+    time.sleep(settle_time)
+    # Both channels idle: the encoder counts hold until the next command
+    if completed and snap.buf1 == BUFFER_IDLE and snap.buf2 == BUFFER_IDLE:
+        status.mark_settled()
+    elapsed = time.monotonic() - start
+    if stats is not None:
+        stats.add(elapsed, completed)
+    return completed, elapsed
@@ -0,0 +1,120 @@
+"""
+REACH manipulator move profiling hooks
+
+Light-weight per-move timing used by benchmark.py. The automation
+scripts wrap each move in profiling.move() and its verification and
+completion wait in profiling.phase(), and make their fixed dwells with
+profiling.sleep(); the benchmark switches profiling on and wraps the
+Roboclaw calls in timed(), which report into whatever move is running
+on the calling thread. A dwell inside a timed call or the wait phase is
+already counted there and is not reported again. When profiling is off
+every hook is a no-op.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+enabled = False
+records = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class MoveRecord:
+    def __init__(self, tendon, distance):
+        self.tendon = tendon
+        self.distance = distance
+        self.thread = threading.current_thread().name
+        self.start = time.monotonic()
+        self.end = None
+        self.attempts = 0
+        # name -> [calls, seconds]
+        self.timings = {}
+
+    def add(self, name, seconds):
+        entry = self.timings.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def as_dict(self):
+        return {
+            "tendon": self.tendon,
+            "distance": self.distance,
+            "thread": self.thread,
+            "start": self.start,
+            "duration": self.end - self.start,
+            "attempts": self.attempts,
+            "timings": {name: {"calls": calls, "seconds": seconds}
+                        for name, (calls, seconds) in self.timings.items()},
+        }
+
+
+def current():
+    return getattr(_local, "record", None)
+
+
+@contextmanager
+def move(tendon, distance):
+    if not enabled:
+        yield None
+        return
+    record = MoveRecord(tendon, distance)
+    _local.record = record
+    try:
+        yield record
+    finally:
+        record.end = time.monotonic()
+        _local.record = None
+        with _lock:
+            records.append(record)
+
+
+@contextmanager
+def phase(name):
+    if not enabled or current() is None:
+        yield
+        return
+    start = time.monotonic()
+    outer = getattr(_local, "phase", None)
+    _local.phase = name
+    try:
+        yield
+    finally:
+        _local.phase = outer
+        add("phase:" + name, time.monotonic() - start)
+
+
+# Time one call under name, e.g. a Roboclaw transaction. duration, if
+# given, is recorded instead of the measured time.
+@contextmanager
+def timed(name, duration=None):
+    start = time.monotonic()
+    _local.depth = getattr(_local, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+        add(name, time.monotonic() - start if duration is None else duration)
+
+
+# A fixed dwell, reported as "sleep" unless it is part of a timed call
+# or the completion wait
+def sleep(seconds):
+    start = time.monotonic()
+    time.sleep(seconds)
+    if getattr(_local, "depth", 0) or getattr(_local, "phase", None) == "wait":
+        return
+    add("sleep", time.monotonic() - start)
+
+
+def add(name, seconds):
+    record = current()
+    if record is not None:
+        record.add(name, seconds)
+
+
+def attempt():
+    record = current()
+    if record is not None:
+        record.attempts += 1
@@ -8,103 +8,164 @@ in an upright orientation using the Xbox controller as the starting
 position, then the script will generate the workspace.
 
 Usage:
-Initially move the manipulator into an upright position by manually
-controlling it with A, B, X, and Y tightening and the D-pad loosening.
-Once the manipulator is upright and the inline load cells are balanced,
-press the left trigger to begin workspace generation. 
+With auto_balance set the script first brings the four inline load
+cells to the same force, which leaves the manipulator upright. Adjust
+by hand if needed with A, B, X, and Y tightening and the D-pad
+loosening, or hold the right trigger and push the analog sticks for
+finer continuous moves. Once the manipulator is upright and the inline load cells
+are balanced, press the left trigger to begin workspace generation. 
+
+Every completed step is written to the run journal. After an
+interruption, run the script again with --resume to check the encoders
+against the journal and continue from the last completed step without
+re-aligning.
+
+Pass --sim to run against the simulated rig in sim.py instead of the
+hardware.
 """
 
+import os
 import signal
+import sys
+import sim
+# Swap in the simulated rig before any hardware module is imported (--sim)
+sim.install_if_requested()
 from xbox360controller import Xbox360Controller
 import time
-from roboclaw_3 import Roboclaw
-from Phidget22.Phidget import *
-from Phidget22.Devices.VoltageRatioInput import *
-import csv, math
-
-baudrate = 230400
+import hardware
+from loadcells import LoadCellSession
+from sample_logger import BufferedCsvWriter
+from telemetry_log import TelemetryWriter
+from roboclaw_dispatch import Dispatcher
+from motion import DwellStats, check_motor_movement, wait_for_completion
+from status import ControllerStatus, enc
+import profiling
+from sequences import compile_sequence, load_sequence, optimize, report_optimization, run_program, without_returns
+from buffered import BufferedLineRunner, run_program_buffered
+import home
+from coordinated import CoordinatedMover
+import journal
+from tension import TensionRegulator
+from balance import balance_loads
+from command_queue import CommandQueue
+from stick_jog import StickJogger
+from teleop_session import SessionRecorder, worker_encoders
+import math
+
+# Ports, baud rates, addresses, speeds and load cell calibration come from
+# the hardware profile (hardware_profile.json)
+rig = hardware.connect(hardware.load_profile())
 
 # Roboclaw 1 controls motors 1–2
-rc1 = Roboclaw("/dev/ttyACM0", baudrate)
+rc1, add1 = rig.controller("rc1")
 # Roboclaw 2 controls motors 3–4
-rc2 = Roboclaw("/dev/ttyACM1", baudrate)
+rc2, add2 = rig.controller("rc2")
 
-rc1.Open()
-rc2.Open()
+# Each Roboclaw gets its own worker so both controllers are commanded concurrently
+dispatch = Dispatcher()
+dispatch.add(rc1, "rc1")
+dispatch.add(rc2, "rc2")
 
-# Addresses
-add1 = 0x80
-add2 = 0x81
+# Both-motor status snapshots, cached for one control tick
+controller_status = {
+    rc1: ControllerStatus(rc1, add1),
+    rc2: ControllerStatus(rc2, add2),
+}
 
-spd = 144000
-acc = 144000
-motmov = 11520 # Prev command was 46080
+spd = rig.spd
+acc = rig.acc
+# Quarter steps, overriding the profile's rig.motmov (46080)
+motmov = 11520
 
 # Set the steps per longitudinal path
 longitudinal_path = 5
 
-# Four load cell parameters from calibration
-gain0 = 56230
-offset0 = 2.8131
-gain1 = 56251
-offset1 = 5.1885
-gain2 = 56145
-offset2 = 0.3451
-gain3 = 56145
-offset3 = 1.2198
+# Balance the load cells automatically before the operator takes over,
+# until all four forces are within balance_tolerance of their mean
+auto_balance = True
+balance_tolerance = 0.5
 
-# Load cell CSV filename
-csv_file = 'reach_load_cell.csv'
+# Hold the tendons that are not driving a step within tension_band of their
+# force at the start of the run with the closed-loop regulator in tension.py,
+# at tension_rate corrections per second at most per tendon.
+# Not used with buffered_lines, whose queued moves a correction would flush.
+tension_control = True
+tension_band = 1.5
+tension_rate = 5
 
+# The longitudinal lines are described in this file and compiled before the run
+sequence_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'workspace_sequence.json')
 
-# Motor Control Functions
-def check_motor_movement(rc, address, motor, send_command_fn, 
-                         settle_time=0.05, move_time=0.2, encoder_threshold=50):
+# Add the extra driving tendon moves on alternate steps of each line
+alternate_steps = True
 
-    # Encoder State before
-    if motor == 1:
-        _, enc_before, _ = rc.ReadEncM1(address)
-    else:
-        _, enc_before, _ = rc.ReadEncM2(address)
+# Merge repeated moves and drop cancelling +/- pairs before the run. Mark
+# moves with "keep" in the sequence file to protect them from this pass.
+optimize_sequence = True
 
-    # Send command
-    send_command_fn()
-    time.sleep(settle_time)
+# Run the moves of a step together as one coordinated move, all motors
+# starting and finishing at the same time, instead of one after another
+coordinated_moves = True
 
-    # Read buffer
-    _, buf1, buf2 = rc.ReadBuffers(address)
-    buf = buf1 if motor == 1 else buf2
+# Load each whole longitudinal line into the Roboclaw command buffers and
+# only monitor it, instead of verifying and waiting on every step. Steps
+# are checked afterwards against the encoder trace.
+buffered_lines = False
 
-    # Read speed
-    if motor == 1:
-        _, speed, _ = rc.ReadSpeedM1(address)
-    else:
-        _, speed, _ = rc.ReadSpeedM2(address)
+# The encoder counts of the aligned upright pose are saved here when the
+# run starts
+home_file = 'reach_home.json'
 
-    time.sleep(move_time)
+# Return upright after each line with one absolute position move per motor
+# instead of replaying the line's back steps
+absolute_home = False
 
-    # Encoder State after
-    if motor == 1:
-        _, enc_after, _ = rc.ReadEncM1(address)
-    else:
-        _, enc_after, _ = rc.ReadEncM2(address)
+# While the right trigger is held the analog sticks drive the tendons at
+# up to jog_speed counts/s, updated jog_rate times a second
+stick_jogging = True
+jog_speed = 36000
+jog_rate = 50
+
+# Manual alignment commands are recorded here with timestamps and encoder
+# counts; replay with teleop_session.py. None turns recording off.
+manual_session_file = 'reach_manual.jsonl'
 
-    encoder_delta = abs(enc_after - enc_before)
+# Four load cell parameters from calibration
+gains = rig.gains
+offsets = rig.offsets
+
+# Load cell CSV filename
+csv_file = 'reach_load_cell.csv'
+
+# Binary telemetry log (forces and encoder counts), read with telemetry_log.read_telemetry
+telemetry_file = 'reach_telemetry.bin'
 
-    # Check movement success
-    success = (encoder_delta >= encoder_threshold) or (speed != 0)
+# Completed steps with their encoder counts, for --resume
+journal_file = 'reach_journal.jsonl'
 
-    diagnostics = {
-        "enc_before": enc_before,
-        "enc_after": enc_after,
-        "encoder_delta": encoder_delta,
-        "buffer": buf,
-        "speed": speed
-    }
+# Continue an interrupted run from the journal
+resume_run = '--resume' in sys.argv
+if resume_run:
+    # Keep the logs of the interrupted run, the resumed part gets its own
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    csv_file = csv_file.replace('.csv', '_resumed_%s.csv' % stamp)
+    telemetry_file = telemetry_file.replace('.bin', '_resumed_%s.bin' % stamp)
 
-    return success, diagnostics
+# Load cell data interval (ms) for all four channels, a list for one per
+# channel or 'max' for the fastest rate of every bridge. Rows are aligned
+# on the shortest interval. A change trigger of 0 reports every sample,
+# so tension transients during a move are not filtered out.
+load_cell_interval = 8
+load_cell_trigger = 0
 
+# Moves wait for the controller to report completion, then let the tendons
+# settle for tension_settle seconds (this replaces a fixed 3 s dwell)
+tension_settle = 0.25
+move_timeout = 10
+dwell = DwellStats(fixed_dwell=3)
 
+
+# Motor Control Functions
 def send_and_verify(rc, address, motor, command_fn, retries = 3):
     if rc == rc1:
         if motor == 1:
@@ -117,200 +178,193 @@ def send_and_verify(rc, address, motor, command_fn, retries = 3):
         else:
             motor_print = 4
 
+    session.mark_step()
+
     for attempt in range(1, retries + 1):
-        success, diag = check_motor_movement(rc, address, motor, command_fn)
+        profiling.attempt()
+        success, diag = check_motor_movement(controller_status[rc], motor, command_fn)
 
         if success:
             print(f"[OK] Motor {motor_print} moved successfully. Diagnostics: {diag}")
             return True
 
         print(f"[WARNING] Motor {motor_print} failed attempt {attempt}: {diag}")
-        time.sleep(0.1)
+        profiling.sleep(0.1)
 
     print(f"[ERROR] Motor {motor_print} failed to move after {retries} attempts")
     return False
 
 
-def move_one_plus(button=None):
-    def cmd():
-        rc1.SpeedAccelDistanceM2(add1, spd, acc, motmov, 1)
+# Tendon -> (Roboclaw, address, channel, sign of the speed that tightens it)
+tendons = rig.tendons
 
-    send_and_verify(rc1, add1, motor=2, command_fn=cmd)
-    print("Motor 1 Plus")
-    time.sleep(3)
-    voltageChange()
 
+# Queue a move of distance counts on a tendon, positive tightens
+def move_tendon(tendon, distance):
+    rc, address, motor, sign = tendons[tendon]
+    status = controller_status[rc]
+    speed = sign*acc if distance > 0 else -sign*acc
 
-def move_two_plus(button=None):
     def cmd():
-        rc1.SpeedAccelDistanceM1(add1, spd, -acc, motmov, 1)
+        if motor == 1:
+            rc.SpeedAccelDistanceM1(address, spd, speed, abs(distance), 1)
+        else:
+            rc.SpeedAccelDistanceM2(address, spd, speed, abs(distance), 1)
 
-    send_and_verify(rc1, add1, motor=1, command_fn=cmd)
-    print("Motor 2 Plus")
-    time.sleep(3)
-    voltageChange()
+    def run():
+        with profiling.move(tendon, distance):
+            with profiling.phase("verify"):
+                send_and_verify(rc, address, motor=motor, command_fn=cmd)
+            print("Motor %d %s" % (tendon, "Plus" if distance > 0 else "Minus"))
+            with profiling.phase("wait"):
+                wait_for_completion(status, motor, settle_time=tension_settle,
+                                    timeout=move_timeout, stats=dwell)
+            if status.settled:
+                telemetry.set_encoder(tendon, enc(status.last, motor))
 
+    return dispatch.submit(rc, run)
 
-def move_three_plus(button=None):
-    def cmd():
-        rc2.SpeedAccelDistanceM1(add2, spd, -acc, motmov, 1)
 
-    send_and_verify(rc2, add2, motor=1, command_fn=cmd)
-    print("Motor 3 Plus")
-    time.sleep(3)
-    voltageChange()
+recorder = None
 
 
-def move_four_plus(button=None):
-    def cmd():
-        rc2.SpeedAccelDistanceM2(add2, spd, acc, motmov, 1)
+def manual_move(tendon, distance):
+    if recorder is not None:
+        recorder.move(tendon, distance)
+    move_tendon(tendon, distance).result()
 
-    send_and_verify(rc2, add2, motor=2, command_fn=cmd)
-    print("Motor 4 Plus")
-    time.sleep(3)
-    voltageChange()
 
+# Controller callbacks only queue the move; repeated presses of one button
+# merge into a single move of up to four presses
+jog = CommandQueue(manual_move, maxsize=8, max_distance=4*motmov)
 
-def move_one_minus(button=None):
-    def cmd():
-        rc1.SpeedAccelDistanceM2(add1, spd, -acc, motmov, 1)
 
-    send_and_verify(rc1, add1, motor=2, command_fn=cmd)
-    print("Motor 1 Minus")
-    time.sleep(3)
-    voltageChange()
+def move_one_plus(button=None):
+    return jog.push(1, motmov)
 
 
-def move_two_minus(button=None):
-    def cmd():
-        rc1.SpeedAccelDistanceM1(add1, spd, acc, motmov, 1)
+def move_two_plus(button=None):
+    return jog.push(2, motmov)
+
+
+def move_three_plus(button=None):
+    return jog.push(3, motmov)
+
+
+def move_four_plus(button=None):
+    return jog.push(4, motmov)
 
-    send_and_verify(rc1, add1, motor=1, command_fn=cmd)
-    print("Motor 2 Minus")
-    time.sleep(3)
-    voltageChange()
+
+def move_one_minus(button=None):
+    return jog.push(1, -motmov)
+
+
+def move_two_minus(button=None):
+    return jog.push(2, -motmov)
 
 
 def move_three_minus(button=None):
-    def cmd():
-        rc2.SpeedAccelDistanceM1(add2, spd, acc, motmov, 1)
-    
-    send_and_verify(rc2, add2, motor=1, command_fn=cmd)
-    print("Motor 3 Minus")
-    time.sleep(3)
-    voltageChange()
+    return jog.push(3, -motmov)
 
 
 def move_four_minus(button=None):
-    def cmd():
-        rc2.SpeedAccelDistanceM2(add2, spd, -acc, motmov, 1)
-    
-    send_and_verify(rc2, add2, motor=2, command_fn=cmd)
-    print("Motor 4 Minus")
-    time.sleep(3)
-    voltageChange()
+    return jog.push(4, -motmov)
 
 
 def move_motor_minus(axis):
     if axis.x == -1 and axis.y == 0:
-        def cmd():
-            rc1.SpeedAccelDistanceM1(add1, spd, acc, motmov, 1)
-        send_and_verify(rc1, add1, motor=1, command_fn=cmd)
-        print("Motor 2 Minus")
-        time.sleep(3)
-        voltageChange()
+        move_two_minus()
 
     if axis.x == 0 and axis.y == -1:
-        def cmd():
-            rc2.SpeedAccelDistanceM1(add2, spd, acc, motmov, 1)
-        send_and_verify(rc2, add2, motor=1, command_fn=cmd)
-        print("Motor 3 Minus")
-        time.sleep(3)
-        voltageChange()
+        move_three_minus()
 
     if axis.x == 1 and axis.y == 0:
-        def cmd():
-            rc2.SpeedAccelDistanceM2(add2, spd, -acc, motmov, 1)
-        send_and_verify(rc2, add2, motor=2, command_fn=cmd)
-        print("Motor 4 Minus")
-        time.sleep(3)
-        voltageChange()
+        move_four_minus()
 
     if axis.x == 0 and axis.y == 1:
-        def cmd():
-            rc1.SpeedAccelDistanceM2(add1, spd, -acc, motmov, 1)
-        send_and_verify(rc1, add1, motor=2, command_fn=cmd)
-        print("Motor 1 Minus")
-        time.sleep(3)
-        voltageChange()
-
-
-def onVoltageRatioInput0_VoltageRatioChange(self, voltageRatio):
-    #print("VoltageRatio [0]: " + str(voltageRatio))
-    weight0 = voltageRatio*gain0 - offset0 #weight = (voltageRatio - offset0)*gain0
-    print("Force [0]: " + str(weight0))
-    with open(csv_file, 'a', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow([timestamp, weight0, 0, 0, 0])
-
-def onVoltageRatioInput1_VoltageRatioChange(self, voltageRatio):
-    #print("VoltageRatio [1]: " + str(voltageRatio))
-    weight1 = voltageRatio*gain1 - offset1 #weight = (voltageRatio - offset0)*gain0
-    print("Force [1]: " + str(weight1))
-    with open(csv_file, 'a', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow([timestamp, 0, weight1, 0, 0])
-
-def onVoltageRatioInput2_VoltageRatioChange(self, voltageRatio):
-    #print("VoltageRatio [2]: " + str(voltageRatio))
-    weight2 = voltageRatio*gain2 - offset2 #weight = (voltageRatio - offset0)*gain0
-    print("Force [2]: " + str(weight2))
-    with open(csv_file, 'a', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow([timestamp, 0, 0, weight2, 0])
-
-def onVoltageRatioInput3_VoltageRatioChange(self, voltageRatio):
-    #print("VoltageRatio [3]: " + str(voltageRatio))
-    weight3 = voltageRatio*gain3 - offset3 #weight = (voltageRatio - offset0)*gain0
-    print("Force [3]: " + str(weight3))
-    with open(csv_file, 'a', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow([timestamp, 0, 0, 0, weight3])
-
-
-def voltageChange():
-    # Assign any event handlers needed before calling open so that no events are missed
-    voltageRatioInput0.setOnVoltageRatioChangeHandler(onVoltageRatioInput0_VoltageRatioChange)
-    voltageRatioInput1.setOnVoltageRatioChangeHandler(onVoltageRatioInput1_VoltageRatioChange)
-    voltageRatioInput2.setOnVoltageRatioChangeHandler(onVoltageRatioInput2_VoltageRatioChange)
-    voltageRatioInput3.setOnVoltageRatioChangeHandler(onVoltageRatioInput3_VoltageRatioChange)
-
-    # Open Phidgets and wait for attachment
-    voltageRatioInput0.openWaitForAttachment(5000)
-    voltageRatioInput1.openWaitForAttachment(5000)
-    voltageRatioInput2.openWaitForAttachment(5000)
-    voltageRatioInput3.openWaitForAttachment(5000)
+        move_one_minus()
 
 
-try:
-    with Xbox360Controller(0, axis_threshold=0.6) as controller:
+# Compile the workspace sequence up front, before anything moves
+program = compile_sequence(load_sequence(sequence_file), longitudinal_path, motmov,
+                           alternate=alternate_steps)
+if absolute_home:
+    program = without_returns(program)
+if optimize_sequence:
+    optimized = optimize(program)
+    report_optimization(program, optimized, speed=acc, accel=spd)
+    program = optimized
+
+
+# Load cell samples are queued here and written in batches by a writer thread
+csv_log = BufferedCsvWriter(csv_file, ['Timestamp', 'LoadCell1', 'LoadCell2',
+                                       'LoadCell3', 'LoadCell4', 'Step'],
+                            flush_interval=0.5)
+telemetry = TelemetryWriter(telemetry_file)
+
+
+# Moves all tendons of a step together, speed-scaled so they finish together
+mover = CoordinatedMover(tendons, controller_status, dispatch, spd, acc,
+                         settle_time=tension_settle, timeout=move_timeout, stats=dwell,
+                         on_encoder=telemetry.set_encoder)
+
+
+# Encoder count of every tendon motor, read between steps
+def read_encoders():
+    return home.capture(tendons, controller_status)
+
 
-        # Initialize CSV file with header
-        with open(csv_file, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['Timestamp', 'LoadCell1', 'LoadCell2', 'LoadCell3', 'LoadCell4'])
+run_journal = journal.RunJournal(journal_file, encoders=read_encoders, tendons=tendons)
+# Ctrl-C lets the step in flight finish, so the journal can resume after it
+run_journal.hold_interrupts()
 
-        # Create Phidget channels
-        voltageRatioInput0 = VoltageRatioInput()
-        voltageRatioInput1 = VoltageRatioInput()
-        voltageRatioInput2 = VoltageRatioInput()
-        voltageRatioInput3 = VoltageRatioInput()
 
-        # Set addressing parameters to specify which channel to open
-        voltageRatioInput0.setChannel(0)
-        voltageRatioInput1.setChannel(1)
-        voltageRatioInput2.setChannel(2)
-        voltageRatioInput3.setChannel(3)
+# Coordinated and buffered moves log the step id of the compiled sequence
+def begin_step(moves):
+    if coordinated_moves or buffered_lines:
+        session.mark_step(moves[0].step)
+    regulator.set_step(moves)
+    run_journal.begin(moves)
+
+
+# Absolute move of every motor to the captured upright pose
+def return_home(line=None):
+    reached = home.move_to(home_pose, tendons, controller_status, dispatch,
+                           accel=spd, speed=acc, settle_time=tension_settle, stats=dwell)
+    for tendon, count in reached.items():
+        telemetry.set_encoder(tendon, count)
+    run_journal.home(read_encoders())
+    print(f"Returned upright, largest encoder error {home.error(home_pose, reached)} counts")
+
+
+def log_load_cell(timestamp, step, forces):
+    csv_log.write([timestamp] + forces + [step])
+    telemetry.append(timestamp, step, forces)
+
+
+# Load cells are opened once and stream for the whole run
+session = LoadCellSession(gains, offsets,
+                          on_row=log_load_cell,
+                          data_interval=load_cell_interval,
+                          change_trigger=load_cell_trigger,
+                          tendons=rig.load_cell_tendons)
+
+# Closed-loop tension on the tendons not driving the current step
+regulator = TensionRegulator(session, tendons, controller_status, dispatch, spd, acc,
+                             band=tension_band, control_rate=tension_rate,
+                             on_correction=run_journal.correction)
+regulate_tension = tension_control and not buffered_lines
+sticks = None
+
+
+try:
+    with Xbox360Controller(0, axis_threshold=0.6) as controller:
+
+        # Open Phidgets once and start streaming
+        session.open()
+        # Effective sample rate, measured before the run
+        session.report(session.measure_rates())
+        session.start()
 
         controller.button_y.when_pressed = move_one_plus
         controller.button_x.when_pressed = move_two_plus
@@ -318,243 +372,105 @@ try:
         controller.button_b.when_pressed = move_four_plus
         controller.hat.when_moved = move_motor_minus
 
-        print("Align manipulator upright and balance loads.")
-        print("Press LEFT TRIGGER to begin workspace generation...")
-
-        # Wait until left trigger is pressed
-        while True:
-            if controller.trigger_l.value > 0.5:
-                print("Beginning workspace generation sequence...")
-                break
-            time.sleep(0.1)
-
-        # M1 longitudinal line
-        print("Started M1 Longitudinal Line")
-        for i in range(longitudinal_path):
-            move_one_plus()
-            move_three_minus()
-            if i % 2 == 0:
-                move_three_minus()
-            move_two_plus()
-            move_two_minus()
-            move_four_plus()
-            move_four_minus()
-            if i == longitudinal_path - 1:
-                for j in range(longitudinal_path):
-                    move_two_plus()
-                    move_two_minus()
-                    move_four_plus()
-                    move_four_minus()
-                    move_one_minus()
-                    move_three_plus()
-                    if j % 2 == 0:
-                        move_three_plus()
-        print("Finished M1 Longitudinal Line")
-        time.sleep(3)
-
-        print("Started M1 M2 Longitudinal Line")
-        # M1 M2 longitudinal line
-        for i in range(longitudinal_path):
-            move_one_plus()
-            move_two_plus()
-            move_three_plus()
-            move_three_minus()
-            move_four_plus()
-            move_four_minus()
-            move_three_minus()
-            move_four_minus()
-            if i % 2 == 0:
-                move_three_minus()
-                move_four_minus()
-            if i == longitudinal_path - 1:
-                for j in range(longitudinal_path):
-                    move_three_plus()
-                    move_three_minus()
-                    move_four_plus()
-                    move_four_minus()
-                    move_one_minus()
-                    move_two_minus()
-                    move_three_plus()
-                    move_four_plus()
-                    if j % 2 == 0:
-                        move_three_plus()
-                        move_four_plus()
-        print("Finished M1 M2 Longitudinal Line")
-        time.sleep(3)
-
-        print("Started M2 Longitudinal Line")
-        # M2 longitudinal line
-        for i in range(longitudinal_path):
-            move_two_plus()
-            move_three_plus()
-            move_three_minus()
-            move_one_plus()
-            move_one_minus()
-            move_four_minus()
-            if i % 2 == 0:
-                move_four_minus()
-            if i == longitudinal_path - 1:
-                for j in range(longitudinal_path):
-                    move_three_plus()
-                    move_three_minus()
-                    move_one_plus()
-                    move_one_minus()
-                    move_two_minus()
-                    move_four_plus()
-                    if j % 2 == 0:
-                        move_four_plus()
-        print("Finished M2 Longitudinal Line")
-        time.sleep(3)
-
-        print("Started M2 M3 Longitudinal Line")
-        # M2 M3 longitudinal line
-        for i in range(longitudinal_path):
-            move_two_plus()
-            move_three_plus()
-            move_four_plus()
-            move_four_minus()
-            move_one_plus()
-            move_one_minus()
-            move_four_minus()
-            move_one_minus()
-            if i % 2 == 0:
-                move_four_minus()
-                move_one_minus()
-            if i == longitudinal_path - 1:
-                for j in range(longitudinal_path):
-                    move_four_plus()
-                    move_four_minus()
-                    move_one_plus()
-                    move_one_minus()
-                    move_three_minus()
-                    move_two_minus()
-                    move_one_plus()
-                    move_four_plus()
-                    if j % 2 == 0:
-                        move_one_plus()
-                        move_four_plus()
-        print("Finished M2 M3 Longitudinal Line")
-        time.sleep(3)
-        
-        print("Started M3 Longitudinal Line")
-        # M3 longitudinal line
-        for i in range(longitudinal_path):
-            move_three_plus()
-            move_four_plus()
-            move_four_minus()
-            move_two_plus()
-            move_two_minus()
-            move_one_minus()
-            if i % 2 == 0:
-                move_one_minus()
-            if i == longitudinal_path - 1:
-                for j in range(longitudinal_path):
-                    move_four_plus()
-                    move_four_minus()
-                    move_two_plus()
-                    move_two_minus()
-                    move_three_minus()
-                    move_one_plus()
-                    if j % 2 == 0:
-                        move_one_plus()
-        print("Finished M3 Longitudinal Line")
-        time.sleep(3)
-        
-        print("Started M3 M4 Longitudinal Line")
-        # M3 M4 longitudinal line
-        for i in range(longitudinal_path):
-            move_three_plus()
-            move_four_plus()
-            move_one_plus()
-            move_one_minus()
-            move_two_plus()
-            move_two_minus()
-            move_one_minus()
-            move_two_minus()
-            if i % 2 == 0:
-                move_one_minus()
-                move_two_minus()
-            if i == longitudinal_path - 1:
-                for j in range(longitudinal_path):
-                    move_one_plus()
-                    move_one_minus()
-                    move_two_plus()
-                    move_two_minus()
-                    move_three_minus()
-                    move_four_minus()
-                    move_one_plus()
-                    move_two_plus()
-                    if j % 2 == 0:
-                        move_one_plus()
-                        move_two_plus()
-        print("Finished M3 M4 Longitudinal Line")
-        time.sleep(3)
-
-        
-        print("Started M4 Longitudinal Line")
-        # M4 longitudinal line
-        for i in range(longitudinal_path):
-            move_four_plus()
-            move_one_plus()
-            move_one_minus()
-            move_three_plus()
-            move_three_minus()
-            move_two_minus()
-            if i % 2 == 0:
-                move_two_minus()
-            if i == longitudinal_path - 1:
-                for j in range(longitudinal_path):
-                    move_one_plus()
-                    move_one_minus()
-                    move_three_plus()
-                    move_three_minus()
-                    move_four_minus()
-                    move_two_plus()
-                    if j % 2 == 0:
-                        move_two_plus()
-        print("Finished M4 Longitudinal Line")
-        time.sleep(3)
-        
-        print("Started M4 M1 Longitudinal Line")
-        # M4 M1 longitudinal line
-        for i in range(longitudinal_path):
-            move_four_plus()
-            move_one_plus()
-            move_two_plus()
-            move_two_minus()
-            move_three_plus()
-            move_three_minus()
-            move_two_minus()
-            move_three_minus()
-            if i % 2 == 0:
-                move_two_minus()
-                move_three_minus()
-            if i == longitudinal_path - 1:
-                for j in range(longitudinal_path):
-                    move_two_plus()
-                    move_two_minus()
-                    move_three_plus()
-                    move_three_minus()
-                    move_one_minus()
-                    move_four_minus()
-                    move_three_plus()
-                    move_two_plus()
-                    if j % 2 == 0:
-                        move_three_plus()
-                        move_two_plus()
-        print("Finished M4 M1 Longitudinal Line")
-        time.sleep(3)
-        
+        if resume_run:
+            state = journal.load(journal_file)
+            home_pose = state["home"] or home.load(home_file)
+            problems = journal.check(state, program, read_encoders())
+            if problems:
+                for problem in problems:
+                    print(f"[ERROR] Cannot resume: {problem}")
+                sys.exit(1)
+            program = journal.remaining(program, state)
+            run_journal.reopen(state)
+            print(f"Resuming after step {state['last_step']}, {len(program)} moves left")
+        else:
+            if auto_balance:
+                print("Balancing tendon loads...")
+                balance_loads(session, mover, tolerance=balance_tolerance,
+                              max_force=rig.max_force)
+
+            if manual_session_file:
+                recorder = SessionRecorder(manual_session_file, tendons,
+                                           encoders=worker_encoders(tendons, controller_status, dispatch))
+
+            if stick_jogging:
+                sticks = StickJogger(controller, tendons, dispatch, controller_status,
+                                     jog_speed, acc, rate=jog_rate,
+                                     on_speed=recorder.speed if recorder is not None else None)
+                sticks.start()
+
+            print("Align manipulator upright and balance loads.")
+            print("Press LEFT TRIGGER to begin workspace generation...")
+
+            # Wait until left trigger is pressed
+            while True:
+                if controller.trigger_l.value > 0.5:
+                    print("Beginning workspace generation sequence...")
+                    # Let any manual alignment moves finish first
+                    if sticks is not None:
+                        sticks.stop()
+                    jog.join()
+                    dispatch.barrier()
+                    if recorder is not None:
+                        recorder.close()
+                    break
+                time.sleep(0.1)
+
+            # Capture the aligned upright pose as the home position
+            home_pose = home.capture(tendons, controller_status)
+            home.save(home_file, home_pose)
+            print(f"Upright pose saved to {home_file}: {home_pose}")
+
+            run_journal.start(program, home_pose)
+
+        if regulate_tension:
+            regulator.start()
+
+        if buffered_lines:
+            # Each line runs from the controller buffers, lines finish on both controllers
+            runner = BufferedLineRunner(tendons, controller_status, dispatch, spd, acc,
+                                        on_encoder=telemetry.set_encoder)
+            run_program_buffered(program, runner, line_pause=3,
+                                 on_line=begin_step,
+                                 on_line_end=return_home if absolute_home else None,
+                                 on_step_done=run_journal.commit)
+        else:
+            # Run all longitudinal lines, each step finishes on both controllers
+            # before the next starts
+            run_program(program, move_tendon, dispatch.barrier, line_pause=3,
+                        on_line_end=return_home if absolute_home else None,
+                        move_vector=mover.move if coordinated_moves else None,
+                        on_step=begin_step, on_step_done=run_journal.commit)
+
+        if regulate_tension:
+            regulator.stop()
+            regulator.report()
+
+        # Take out whatever error the relative moves left behind
+        return_home()
+
         print("Workspace generation complete. Manipulator returned upright.")
+        dwell.report()
+        rig.report_links()
         signal.pause()
 
 except KeyboardInterrupt:
     print("Process interrupted by user.")
+
+finally:
     # Close Phidgets devices
-    voltageRatioInput0.close()
-    voltageRatioInput1.close()
-    voltageRatioInput2.close()
-    voltageRatioInput3.close()
-    pass
+    regulator.stop()
+    if sticks is not None:
+        sticks.stop()
+    jog.close()
+    if recorder is not None:
+        recorder.close()
+    dispatch.shutdown(wait=False)
+    session.stop()
+    session.close()
+    # Flush any queued load cell samples
+    csv_log.close()
+    telemetry.close()
+    run_journal.close()
 
 
@@ -0,0 +1,73 @@
+"""
+REACH manipulator Roboclaw command dispatch
+
+The two Roboclaws sit on independent serial links, so there is no
+reason for motors 3/4 to wait while motors 1/2 are being commanded and
+verified. Each controller gets its own worker thread; work submitted
+for one controller runs in order on that controller's worker, while
+work for different controllers runs concurrently. Every serial
+transaction for a controller should go through its worker so the port
+is never used from two threads at once.
+
+Usage:
+    dispatch = Dispatcher()
+    dispatch.add(rc1, "rc1")
+    dispatch.add(rc2, "rc2")
+
+    dispatch.submit(rc1, send_and_verify, rc1, add1, 2, cmd)
+    dispatch.submit(rc2, send_and_verify, rc2, add2, 1, cmd)
+    dispatch.barrier()      # wait until both controllers are done
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class Dispatcher:
+    def __init__(self):
+        self.workers = {}
+        self.names = {}
+        self.lock = threading.Lock()
+        self.outstanding = []
+
+    def add(self, rc, name=None):
+        name = name or "rc%d" % (len(self.workers) + 1)
+        self.workers[rc] = ThreadPoolExecutor(max_workers=1,
+                                              thread_name_prefix=name)
+        self.names[rc] = name
+
+    # Queue fn on the worker of controller rc and return its Future
+    def submit(self, rc, fn, *args, **kwargs):
+        future = self.workers[rc].submit(fn, *args, **kwargs)
+        with self.lock:
+            self.outstanding.append(future)
+        return future
+
+    # Run fn on the worker of rc and wait for its result
+    def call(self, rc, fn, *args, **kwargs):
+        return self.submit(rc, fn, *args, **kwargs).result()
+
+    # Number of submitted commands that have not finished yet
+    def pending(self):
+        with self.lock:
+            return sum(not f.done() for f in self.outstanding)
+
+    # Wait until everything submitted so far has finished on every
+    # controller. Errors raised on a worker are re-raised here.
+    def barrier(self, timeout=None):
+        with self.lock:
+            futures, self.outstanding = self.outstanding, []
+        done, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            with self.lock:
+                self.outstanding.extend(not_done)
+            raise TimeoutError("%d commands still running after %s s"
+                               % (len(not_done), timeout))
+        results = []
+        for future in futures:
+            results.append(future.result())
+        return results
+
+    def shutdown(self, wait=True):
+        for worker in self.workers.values():
+            worker.shutdown(wait=wait)
@@ -0,0 +1,79 @@
+"""
+REACH manipulator buffered sample logger
+
+CSV writer for high rate sensor samples. Callers (e.g. the Phidget
+event handlers) only append a row to an in-memory deque, which is
+atomic in CPython and never blocks on the writer. A dedicated writer
+thread drains the deque and writes the rows in batches every
+flush_interval seconds, so the file is opened once per run instead of
+once per sample.
+
+close() stops the writer thread and flushes everything still queued;
+the automation scripts call it from their finally block so the tail of
+the run is kept on KeyboardInterrupt. It is also registered with atexit
+as a backstop.
+"""
+
+import atexit
+import collections
+import csv
+import threading
+
+
+class BufferedCsvWriter:
+    def __init__(self, path, header=None, flush_interval=0.5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+
+        self._queue = collections.deque()
+        self._stop = threading.Event()
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        if header is not None:
+            self._writer.writerow(header)
+            self._file.flush()
+
+        self._thread = threading.Thread(target=self._run, name='csv-writer',
+                                        daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # Safe to call from any thread, never blocks
+    def write(self, row):
+        self._queue.append(row)
+
+    def pending(self):
+        return len(self._queue)
+
+    def flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.popleft())
+            except IndexError:
+                break
+        if batch:
+            self._writer.writerows(batch)
+            self._file.flush()
+            self.rows_written += len(batch)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        self._file.close()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,252 @@
+"""
+REACH manipulator motion sequences
+
+Data-driven description of the workspace sweeps. A sequence file (see
+workspace_sequence.json) lists longitudinal lines; each line has an
+"out" step that is repeated longitudinal_path times to bend the
+manipulator and a "back" step repeated longitudinal_path times to
+return it upright. A step is a list of moves written <tendon><+|->,
+e.g. "1+" tightens tendon 1 by one motmov and "3-" loosens tendon 3.
+Moves can be wrapped in a rule to run only on some repetitions:
+
+    {"when": "alternate", "moves": [...]}   on even repetitions
+    {"when": "slack", "moves": [...]}       every side_tendons_slack repetitions
+    {"every": 3, "moves": [...]}            every 3 repetitions
+    {"keep": true, "moves": [...]}          never removed by optimize()
+
+compile_sequence() unrolls the rules once, up front, into a flat list of
+Move tuples that can be inspected, timed and optimized before any
+hardware is touched. run_program() then feeds the stream to the motor
+functions of an automation script, with a barrier between steps, or
+with move_vector as vectors of tendon deltas that move together (see
+coordinated.py).
+without_returns() drops the "back" steps for runs that return upright
+with absolute position moves instead.
+
+optimize() is a peephole pass over a compiled stream: consecutive moves
+of the same tendon within a step are merged into one move of the summed
+distance, and moves that cancel out (e.g. "2+" straight after "2-") are
+dropped. Moves marked keep, such as intentional tension jiggling, are
+left alone.
+
+Usage:
+    python sequences.py workspace_sequence.json --path 5 --slack 4 --optimize
+"""
+
+import argparse
+import json
+import time
+from collections import namedtuple
+
+# One tendon move. distance is in encoder counts, positive tightens.
+Move = namedtuple('Move', 'line phase step tendon distance keep', defaults=(False,))
+
+# Tendon -> Roboclaw index on the standard rig, used for timing estimates
+TENDON_CONTROLLER = {1: 0, 2: 0, 3: 1, 4: 1}
+
+
+def load_sequence(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_move(token, motmov):
+    tendon, sign = int(token[:-1]), token[-1]
+    if tendon not in TENDON_CONTROLLER or sign not in '+-':
+        raise ValueError("Bad move '%s', expected <tendon 1-4><+|->" % token)
+    return tendon, motmov if sign == '+' else -motmov
+
+
+def rule_applies(entry, repetition, alternate, side_tendons_slack):
+    when = entry.get('when')
+    if when == 'alternate':
+        return alternate and repetition % 2 == 0
+    if when == 'slack':
+        return bool(side_tendons_slack) and repetition % side_tendons_slack == 0
+    if 'every' in entry:
+        return repetition % entry['every'] == 0
+    if when is None:
+        return True
+    raise ValueError("Unknown rule %r" % entry)
+
+
+def expand_step(entries, repetition, motmov, alternate, side_tendons_slack):
+    moves = []
+    for entry in entries:
+        if isinstance(entry, str):
+            moves.append(parse_move(entry, motmov) + (False,))
+        elif rule_applies(entry, repetition, alternate, side_tendons_slack):
+            keep = entry.get('keep', False)
+            moves.extend(parse_move(token, motmov) + (keep,) for token in entry['moves'])
+    return moves
+
+
+# Unroll a sequence into a flat list of Moves
+def compile_sequence(sequence, longitudinal_path, motmov, alternate=True,
+                     side_tendons_slack=None, lines=None):
+    program = []
+    step = 0
+    for line in sequence['lines']:
+        if lines is not None and line['name'] not in lines:
+            continue
+        for phase in ('out', 'back'):
+            for repetition in range(longitudinal_path):
+                for tendon, distance, keep in expand_step(line[phase], repetition, motmov,
+                                                          alternate, side_tendons_slack):
+                    program.append(Move(line['name'], phase, step, tendon, distance, keep))
+                step += 1
+    return program
+
+
+# Peephole pass: merge consecutive same-tendon moves within a step and
+# drop the ones that cancel out. Merging against the last kept move lets
+# cancellations cascade, e.g. 2+ 4+ 4- 2- disappears entirely.
+def optimize(program):
+    result = []
+    for move in program:
+        prev = result[-1] if result else None
+        if (prev is not None and prev.step == move.step and prev.tendon == move.tendon
+                and not prev.keep and not move.keep):
+            result.pop()
+            distance = prev.distance + move.distance
+            if distance != 0:
+                result.append(prev._replace(distance=distance))
+        else:
+            result.append(move)
+    return result
+
+
+def report_optimization(before, after, **timing):
+    before_time = estimate_runtime(before, **timing)
+    after_time = estimate_runtime(after, **timing)
+    print(f"[OPTIMIZE] {len(before)} -> {len(after)} commands, estimated runtime "
+          f"{before_time:.1f} s -> {after_time:.1f} s")
+
+
+def steps(program):
+    groups = []
+    for move in program:
+        if groups and groups[-1][0].step == move.step:
+            groups[-1].append(move)
+        else:
+            groups.append([move])
+    return groups
+
+
+# Split a step into vectors in which every tendon appears once, keeping
+# the order of the moves. Repeated moves of a tendon (a jiggle kept by
+# the sequence) start a new vector.
+def vectors(moves):
+    result = []
+    for m in moves:
+        if not result or m.tendon in result[-1]:
+            result.append({})
+        result[-1][m.tendon] = m.distance
+    return result
+
+
+# Rough duration of one move: trapezoidal profile plus the host side
+# verification and settle time
+def move_time(distance, speed, accel, overhead):
+    return abs(distance) / speed + speed / accel + overhead
+
+
+# Estimate the runtime of a program. Moves within a step run in order on
+# their controller, the two controllers run in parallel and every step
+# ends with a barrier.
+def estimate_runtime(program, speed=144000, accel=144000, overhead=0.6,
+                     line_pause=3):
+    total = 0.0
+    line = None
+    for group in steps(program):
+        busy = {}
+        for move in group:
+            controller = TENDON_CONTROLLER[move.tendon]
+            busy[controller] = busy.get(controller, 0.0) + \
+                move_time(move.distance, speed, accel, overhead)
+        total += max(busy.values())
+        if group[0].line != line:
+            line = group[0].line
+            total += line_pause
+    return total
+
+
+def summarize(program):
+    lines = {}
+    for move in program:
+        lines[move.line] = lines.get(move.line, 0) + 1
+    return {"moves": len(program), "steps": len(steps(program)), "lines": lines}
+
+
+# Drop the "back" phase of every line, for runs that return upright with
+# one absolute move per motor (see home.py) instead of the inverse steps
+def without_returns(program):
+    return [m for m in program if m.phase != 'back']
+
+
+# Execute a compiled program. move(tendon, distance) issues one move,
+# barrier() waits until everything issued so far has finished. With
+# move_vector(deltas) every step runs as coordinated vectors instead.
+# on_step(moves) and on_step_done(moves) bracket each step,
+# on_line_end(line) follows each line.
+def run_program(program, move, barrier, line_pause=3, on_step=None, on_line_end=None,
+                move_vector=None, on_step_done=None):
+    line = None
+    for group in steps(program):
+        if group[0].line != line:
+            if line is not None:
+                if on_line_end is not None:
+                    on_line_end(line)
+                print("Finished " + line + " Longitudinal Line")
+                time.sleep(line_pause)
+            line = group[0].line
+            print("Started " + line + " Longitudinal Line")
+        if on_step is not None:
+            on_step(group)
+        if move_vector is not None:
+            # Coordinated moves, every vector finishes before the next starts
+            for deltas in vectors(group):
+                move_vector(deltas)
+        else:
+            for m in group:
+                move(m.tendon, m.distance)
+            barrier()
+        if on_step_done is not None:
+            on_step_done(group)
+    if line is not None:
+        if on_line_end is not None:
+            on_line_end(line)
+        print("Finished " + line + " Longitudinal Line")
+        time.sleep(line_pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile and inspect a REACH motion sequence")
+    parser.add_argument('sequence', nargs='?', default='workspace_sequence.json')
+    parser.add_argument('--path', type=int, default=5, help="longitudinal_path")
+    parser.add_argument('--motmov', type=int, default=11520)
+    parser.add_argument('--slack', type=int, default=None, help="side_tendons_slack")
+    parser.add_argument('--no-alternate', action='store_true')
+    parser.add_argument('--optimize', action='store_true', help="apply the peephole pass")
+    parser.add_argument('--no-returns', action='store_true', help="drop the back steps (absolute home)")
+    parser.add_argument('--list', action='store_true', help="print every move")
+    args = parser.parse_args()
+
+    program = compile_sequence(load_sequence(args.sequence), args.path, args.motmov,
+                               alternate=not args.no_alternate,
+                               side_tendons_slack=args.slack)
+    if args.no_returns:
+        program = without_returns(program)
+    if args.optimize:
+        optimized = optimize(program)
+        report_optimization(program, optimized)
+        program = optimized
+    if args.list:
+        for m in program:
+            print(f"{m.line:6s} {m.phase:4s} step {m.step:3d}  motor {m.tendon} {m.distance:+d}")
+    print(summarize(program))
+    print(f"Estimated runtime: {estimate_runtime(program):.1f} s")
+
+
+if __name__ == '__main__':
+    main()
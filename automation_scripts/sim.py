@@ -0,0 +1,530 @@
+"""
+REACH manipulator simulation backend
+
+Hardware-free stand-ins for the Roboclaw controllers, the Phidget
+VoltageRatioInput load cells and the Xbox 360 controller, plus an
+accelerated clock, so the automation scripts can run end to end on a
+plain Linux box. The fakes are installed as the roboclaw_3,
+Phidget22 and xbox360controller modules, so the scripts run their
+normal code paths (check_motor_movement, send_and_verify, the load cell
+handlers, ...) against them.
+
+Virtual time runs speedup times faster than real time: time.sleep,
+time.monotonic and time.time are patched, so a 3 s dwell takes 3/speedup
+real seconds and timestamps read like a real run. Host side work is not
+sped up, so past about x20 the load cell threads and thread switches
+take a visible share of virtual time and the timings drift. Simulated motors
+follow a trapezoidal-ish profile in virtual time, and the simulated
+load cells report a tension that follows the tendon encoder positions.
+
+Usage:
+    python reach_ee_quarter_workspace_only_curved_checkmove_loadcells.py --sim
+
+    REACH_SIM=1                     same as --sim
+    REACH_SIM_SPEEDUP=20            virtual seconds per real second
+    REACH_SIM_FAIL_RATE=0.05        chance a motion command is ignored
+    REACH_SIM_TRIGGER=1.0           virtual seconds before the left trigger is pressed
+    REACH_SIM_LINK_FAIL_RATE=0.001  chance a serial transaction drops the link until reopened
+    REACH_SIM_LINK_RESET=1          a dropped link also resets the controller's encoders
+
+The scripts call install_if_requested() before importing any hardware
+module.
+"""
+
+import os
+import random
+import signal
+import sys
+import threading
+import time
+import types
+
+_real_sleep = time.sleep
+_real_monotonic = time.monotonic
+_real_time = time.time
+
+# ReadBuffers value for an empty buffer with no command executing
+BUFFER_IDLE = 0x80
+
+# Load cell channel -> (port, motor channel, sign of encoder change that tightens)
+LOAD_CELL_TENDONS = {
+    0: ("/dev/ttyACM0", 2, 1),
+    1: ("/dev/ttyACM0", 1, -1),
+    2: ("/dev/ttyACM1", 1, -1),
+    3: ("/dev/ttyACM1", 2, 1),
+}
+
+# Simulated serial port -> address of the Roboclaw on it
+PORTS = {
+    "/dev/ttyACM0": 0x80,
+    "/dev/ttyACM1": 0x81,
+}
+
+# Fastest speedup whose timings match slower runs
+DEFAULT_SPEEDUP = 20.0
+
+clock = None
+controllers = {}
+settings = {
+    "fail_rate": 0.0,
+    "link_fail_rate": 0.0,
+    "link_reset": False,
+    "trigger_after": 1.0,
+    "accel": 144000,
+    "base_force": 5.0,
+    "stiffness": 2e-5,
+    "noise": 0.02,
+    "seed": 0,
+    # Virtual seconds per serial transaction
+    "serial_latency": 0.0005,
+}
+_random = random.Random(0)
+
+
+class AcceleratedClock:
+    def __init__(self, speedup=DEFAULT_SPEEDUP):
+        self.speedup = speedup
+        self.real_start = _real_monotonic()
+        self.virtual_start = _real_monotonic()
+        self.wall_start = _real_time()
+
+    def elapsed(self):
+        return (_real_monotonic() - self.real_start) * self.speedup
+
+    def monotonic(self):
+        return self.virtual_start + self.elapsed()
+
+    def time(self):
+        return self.wall_start + self.elapsed()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            _real_sleep(seconds / self.speedup)
+        else:
+            _real_sleep(0)
+
+
+def now():
+    return clock.monotonic() if clock is not None else _real_monotonic()
+
+
+class _Segment:
+    def __init__(self, start, duration, distance, speed):
+        self.start = start
+        self.duration = duration
+        self.distance = distance
+        self.speed = speed
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+
+class MotorChannel:
+    def __init__(self):
+        self.base = 0
+        self.queue = []
+        self.lock = threading.Lock()
+        self.commands = 0
+        self.ignored = 0
+        # Constant speed from a SpeedM1/SpeedM2 command, runs until replaced
+        self.velocity = 0
+        self.velocity_start = 0.0
+
+    def _settle(self, t):
+        while self.queue and self.queue[0].end <= t:
+            self.base += self.queue.pop(0).distance
+
+    def position(self, t=None):
+        t = now() if t is None else t
+        with self.lock:
+            self._settle(t)
+            if self.queue and self.queue[0].start <= t:
+                seg = self.queue[0]
+                return int(self.base + seg.distance * (t - seg.start) / seg.duration)
+            if self.velocity:
+                return int(self.base + self.velocity * (t - self.velocity_start))
+            return self.base
+
+    def speed(self, t=None):
+        t = now() if t is None else t
+        with self.lock:
+            self._settle(t)
+            if self.queue and self.queue[0].start <= t:
+                return self.queue[0].speed
+            return self.velocity
+
+    def buffer(self, t=None):
+        t = now() if t is None else t
+        with self.lock:
+            self._settle(t)
+            if not self.queue:
+                return 0 if self.velocity else BUFFER_IDLE
+            return len(self.queue) - 1
+
+    def stop(self):
+        t = now()
+        pos = self.position(t)
+        with self.lock:
+            self.base = pos
+            self.queue = []
+            self.velocity = 0
+
+    # Controller reset or SetEnc: motor stopped, encoder at count
+    def set_position(self, count):
+        self.stop()
+        with self.lock:
+            self.base = count
+
+    # Run at a constant signed speed until the next command
+    def run_at(self, speed):
+        self.commands += 1
+        if settings["fail_rate"] and _random.random() < settings["fail_rate"]:
+            self.ignored += 1
+            return
+        self.stop()
+        with self.lock:
+            self.velocity = speed
+            self.velocity_start = now()
+
+    def move(self, speed, distance, buffered, accel):
+        t = now()
+        self.commands += 1
+        if settings["fail_rate"] and _random.random() < settings["fail_rate"]:
+            self.ignored += 1
+            return
+        if speed == 0 or distance == 0:
+            return
+        duration = abs(distance) / abs(speed) + abs(speed) / accel
+        signed = abs(distance) if speed > 0 else -abs(distance)
+        if not buffered or self.velocity:
+            self.stop()
+        with self.lock:
+            start = self.queue[-1].end if self.queue else t
+            self.queue.append(_Segment(start, duration, signed, speed))
+
+    # Absolute move to position, from where the queue ends if buffered
+    def move_to(self, speed, position, buffered, accel):
+        if buffered:
+            with self.lock:
+                start = self.base + sum(seg.distance for seg in self.queue)
+        else:
+            start = self.position()
+        distance = position - start
+        self.move(abs(speed) if distance >= 0 else -abs(speed), abs(distance), buffered, accel)
+
+
+class FakeRoboclaw:
+    def __init__(self, comport, rate, timeout=0.01, retries=3):
+        self.comport = comport
+        self.rate = rate
+        self.channels = {}
+        self.transactions = 0
+        # A dropped USB link stays down until the port is opened again
+        self.dropped = False
+        self.drops = 0
+
+    def channel(self, address, motor):
+        key = (address, motor)
+        if key not in self.channels:
+            self.channels[key] = MotorChannel()
+            # The instance that drives the motors is the one the load cells follow
+            controllers[self.comport] = self
+        return self.channels[key]
+
+    def _io(self):
+        self.transactions += 1
+        if self.dropped:
+            raise OSError("device reports readiness to read but returned no data (sim)")
+        if settings["link_fail_rate"] and _random.random() < settings["link_fail_rate"]:
+            self.dropped = True
+            self.drops += 1
+            if settings["link_reset"]:
+                for channel in self.channels.values():
+                    channel.set_position(0)
+            raise OSError("device disconnected (sim)")
+        # One short serial round trip
+        time.sleep(settings["serial_latency"])
+
+    def Open(self):
+        self.dropped = False
+        return 1
+
+    def ReadVersion(self, address):
+        self._io()
+        if PORTS.get(self.comport) != address:
+            return (0, "")
+        return (1, "USB Roboclaw 2x15a v4.2.8 (sim)\n")
+
+    def SpeedAccelDistanceM1(self, address, accel, speed, distance, buffer):
+        self._io()
+        self.channel(address, 1).move(speed, distance, buffer == 0, accel or settings["accel"])
+        return True
+
+    def SpeedAccelDistanceM2(self, address, accel, speed, distance, buffer):
+        self._io()
+        self.channel(address, 2).move(speed, distance, buffer == 0, accel or settings["accel"])
+        return True
+
+    def SpeedAccelDistanceM1M2_2(self, address, accel1, speed1, distance1,
+                                 accel2, speed2, distance2, buffer):
+        self._io()
+        self.channel(address, 1).move(speed1, distance1, buffer == 0, accel1 or settings["accel"])
+        self.channel(address, 2).move(speed2, distance2, buffer == 0, accel2 or settings["accel"])
+        return True
+
+    def SpeedM1(self, address, speed):
+        self._io()
+        self.channel(address, 1).run_at(speed)
+        return True
+
+    def SpeedM2(self, address, speed):
+        self._io()
+        self.channel(address, 2).run_at(speed)
+        return True
+
+    def SpeedM1M2(self, address, speed1, speed2):
+        self._io()
+        self.channel(address, 1).run_at(speed1)
+        self.channel(address, 2).run_at(speed2)
+        return True
+
+    def SpeedAccelM1M2(self, address, accel, speed1, speed2):
+        self._io()
+        self.channel(address, 1).run_at(speed1)
+        self.channel(address, 2).run_at(speed2)
+        return True
+
+    def SpeedAccelDeccelPositionM1(self, address, accel, speed, deccel, position, buffer):
+        self._io()
+        self.channel(address, 1).move_to(speed, position, buffer == 0, accel or settings["accel"])
+        return True
+
+    def SpeedAccelDeccelPositionM2(self, address, accel, speed, deccel, position, buffer):
+        self._io()
+        self.channel(address, 2).move_to(speed, position, buffer == 0, accel or settings["accel"])
+        return True
+
+    def SetEncM1(self, address, count):
+        self._io()
+        self.channel(address, 1).set_position(count)
+        return True
+
+    def SetEncM2(self, address, count):
+        self._io()
+        self.channel(address, 2).set_position(count)
+        return True
+
+    def ReadEncM1(self, address):
+        self._io()
+        return (1, self.channel(address, 1).position(), 0)
+
+    def ReadEncM2(self, address):
+        self._io()
+        return (1, self.channel(address, 2).position(), 0)
+
+    def ReadSpeedM1(self, address):
+        self._io()
+        speed = self.channel(address, 1).speed()
+        return (1, abs(speed), 1 if speed < 0 else 0)
+
+    def ReadSpeedM2(self, address):
+        self._io()
+        speed = self.channel(address, 2).speed()
+        return (1, abs(speed), 1 if speed < 0 else 0)
+
+    def ReadEncoders(self, address):
+        self._io()
+        return (1, self.channel(address, 1).position(), self.channel(address, 2).position())
+
+    def ReadISpeeds(self, address):
+        self._io()
+        return (1, self.channel(address, 1).speed(), self.channel(address, 2).speed())
+
+    def ReadBuffers(self, address):
+        self._io()
+        return (1, self.channel(address, 1).buffer(), self.channel(address, 2).buffer())
+
+
+class FakeVoltageRatioInput:
+    def __init__(self):
+        self.channel = 0
+        self.handler = None
+        self.data_interval = 250
+        self.min_data_interval = 8
+        self.change_trigger = 0.0
+        self.bridge_gain = 1
+        # Most samples delivered per wake-up of the sample thread
+        self.max_burst = 8
+        self.attached = False
+        self._thread = None
+
+    def setChannel(self, channel):
+        self.channel = channel
+
+    def getChannel(self):
+        return self.channel
+
+    def setOnVoltageRatioChangeHandler(self, handler):
+        self.handler = handler
+
+    def openWaitForAttachment(self, timeout):
+        self.attached = True
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="sim-vri%d" % self.channel)
+        self._thread.start()
+
+    def close(self):
+        self.attached = False
+
+    def getDataInterval(self):
+        return self.data_interval
+
+    def setDataInterval(self, interval):
+        self.data_interval = max(int(interval), self.min_data_interval)
+
+    def getMinDataInterval(self):
+        return self.min_data_interval
+
+    def getDataRate(self):
+        return 1000.0 / self.data_interval
+
+    def setVoltageRatioChangeTrigger(self, trigger):
+        self.change_trigger = trigger
+
+    def getVoltageRatioChangeTrigger(self):
+        return self.change_trigger
+
+    def setBridgeGain(self, gain):
+        self.bridge_gain = gain
+
+    def voltage_ratio(self):
+        force = settings["base_force"] + _random.gauss(0, settings["noise"])
+        tendon = LOAD_CELL_TENDONS.get(self.channel)
+        if tendon is not None:
+            port, motor, sign = tendon
+            for rc in list(controllers.values()):
+                if rc.comport == port:
+                    for (address, m), channel in list(rc.channels.items()):
+                        if m == motor:
+                            force += settings["stiffness"] * sign * channel.position()
+        return force / 56000.0
+
+    def _run(self):
+        next_sample = now()
+        while self.attached:
+            interval = self.data_interval / 1000.0
+            # Catch up on the samples due in virtual time, so the sample
+            # rate holds even when the real sleep below is the longer one.
+            # A thread that fell further behind than max_burst drops the
+            # backlog rather than calling the handler in a tight loop.
+            due = 0
+            while next_sample <= now() and due < self.max_burst:
+                if self.handler is not None:
+                    self.handler(self, self.voltage_ratio())
+                next_sample += interval
+                due += 1
+            if next_sample <= now():
+                next_sample = now() + interval
+            speedup = clock.speedup if clock is not None else 1.0
+            # Never spin faster than 1 ms of real time per wake-up
+            _real_sleep(max(interval / speedup, 0.001))
+
+
+class _Button:
+    def __init__(self):
+        self.when_pressed = None
+        self.when_released = None
+        self.is_pressed = False
+
+
+class _Axis:
+    def __init__(self):
+        self.x = 0
+        self.y = 0
+        self.when_moved = None
+
+
+class _Trigger:
+    def __init__(self, press_at=None):
+        self.press_at = press_at
+        self.when_moved = None
+
+    @property
+    def value(self):
+        if self.press_at is not None and now() >= self.press_at:
+            return 1.0
+        return 0.0
+
+
+class FakeXbox360Controller:
+    def __init__(self, index=0, axis_threshold=0.2, raw_mode=False):
+        self.index = index
+        self.axis_threshold = axis_threshold
+        for name in ("button_a", "button_b", "button_x", "button_y",
+                     "button_trigger_l", "button_trigger_r",
+                     "button_thumb_l", "button_thumb_r",
+                     "button_start", "button_select", "button_mode"):
+            setattr(self, name, _Button())
+        self.hat = _Axis()
+        self.axis_l = _Axis()
+        self.axis_r = _Axis()
+        # The left trigger presses itself so runs proceed unattended
+        self.trigger_l = _Trigger(now() + settings["trigger_after"])
+        self.trigger_r = _Trigger()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def install(speedup=DEFAULT_SPEEDUP, fail_rate=0.0, trigger_after=1.0, seed=0,
+            link_fail_rate=0.0, link_reset=False):
+    global clock
+    settings.update(fail_rate=fail_rate, trigger_after=trigger_after, seed=seed,
+                    link_fail_rate=link_fail_rate, link_reset=link_reset)
+    _random.seed(seed)
+
+    clock = AcceleratedClock(speedup)
+    time.sleep = clock.sleep
+    time.monotonic = clock.monotonic
+    time.time = clock.time
+    # The scripts end in signal.pause(), return instead of waiting forever
+    signal.pause = lambda: None
+
+    _module("roboclaw_3", Roboclaw=FakeRoboclaw)
+    _module("Phidget22")
+    _module("Phidget22.Phidget")
+    _module("Phidget22.Devices")
+    _module("Phidget22.Devices.VoltageRatioInput", VoltageRatioInput=FakeVoltageRatioInput)
+    _module("xbox360controller", Xbox360Controller=FakeXbox360Controller)
+    print(f"[SIM] Simulated rig installed, virtual time x{speedup:g}")
+
+
+def requested():
+    return "--sim" in sys.argv or os.environ.get("REACH_SIM", "") not in ("", "0")
+
+
+def install_if_requested():
+    if not requested():
+        return False
+    if "--sim" in sys.argv:
+        sys.argv.remove("--sim")
+    install(speedup=float(os.environ.get("REACH_SIM_SPEEDUP", DEFAULT_SPEEDUP)),
+            fail_rate=float(os.environ.get("REACH_SIM_FAIL_RATE", 0)),
+            trigger_after=float(os.environ.get("REACH_SIM_TRIGGER", 1.0)),
+            link_fail_rate=float(os.environ.get("REACH_SIM_LINK_FAIL_RATE", 0)),
+            link_reset=os.environ.get("REACH_SIM_LINK_RESET", "") not in ("", "0"))
+    return True
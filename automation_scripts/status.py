@@ -0,0 +1,101 @@
+"""
+REACH manipulator Roboclaw status snapshots
+
+Reads the state of both channels of a Roboclaw with the combined
+commands, so one packet covers both motors:
+
+    ReadEncoders   encoder counts of M1 and M2
+    ReadISpeeds    speeds of M1 and M2
+    ReadBuffers    command buffer depth of M1 and M2
+
+A full snapshot is three transactions instead of the six single-motor
+reads, and callers can ask for only the parts they need. While the
+controller is known to be idle (no command sent since a completed
+move) its encoder counts stay valid without another read.
+
+A read the controller does not answer is retried, and raises IOError
+after retries attempts, rather than passing the zeros roboclaw_3
+returns for a failed read on as counts.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+Snapshot = namedtuple('Snapshot', 'time enc1 enc2 speed1 speed2 buf1 buf2')
+
+
+def to_signed32(value):
+    if value >= 0x80000000:
+        return value - 0x100000000
+    return value
+
+
+def enc(snapshot, motor):
+    return snapshot.enc1 if motor == 1 else snapshot.enc2
+
+
+def speed(snapshot, motor):
+    return snapshot.speed1 if motor == 1 else snapshot.speed2
+
+
+def buffer(snapshot, motor):
+    return snapshot.buf1 if motor == 1 else snapshot.buf2
+
+
+class ControllerStatus:
+    def __init__(self, rc, address, retries=3):
+        self.rc = rc
+        self.address = address
+        self.retries = retries
+        self.last = None
+        # True while the encoders cannot change (moves done, nothing sent since)
+        self.settled = False
+        self.reads = 0
+        self.lock = threading.Lock()
+        # A watched link (link.WatchedRoboclaw) drops the cache when it reconnects
+        listeners = getattr(rc, "on_reconnect", None)
+        if listeners is not None:
+            listeners.append(self.invalidate)
+
+    # Both values of a combined read, retried while it fails
+    def _read_pair(self, name):
+        for attempt in range(self.retries):
+            ok, first, second = getattr(self.rc, name)(self.address)
+            self.reads += 1
+            if ok:
+                return first, second
+        raise IOError("%s at %s failed %d times" % (name, hex(self.address), self.retries))
+
+    # Fresh read of the requested parts, the rest is carried over from the cache
+    def read(self, encoders=True, speeds=True, buffers=True):
+        last = self.last or Snapshot(0.0, 0, 0, 0, 0, 0, 0)
+        enc1, enc2 = last.enc1, last.enc2
+        speed1, speed2 = last.speed1, last.speed2
+        buf1, buf2 = last.buf1, last.buf2
+        with self.lock:
+            if encoders:
+                enc1, enc2 = self._read_pair("ReadEncoders")
+                enc1, enc2 = to_signed32(enc1), to_signed32(enc2)
+            if speeds:
+                speed1, speed2 = self._read_pair("ReadISpeeds")
+                speed1, speed2 = to_signed32(speed1), to_signed32(speed2)
+            if buffers:
+                buf1, buf2 = self._read_pair("ReadBuffers")
+            self.last = Snapshot(time.monotonic(), enc1, enc2, speed1, speed2, buf1, buf2)
+        return self.last
+
+    # Encoder counts, from the cache while the controller is settled
+    def encoders(self):
+        if self.settled and self.last is not None:
+            return self.last
+        return self.read(speeds=False, buffers=False)
+
+    # Call after sending a command, the cached state no longer holds
+    def invalidate(self):
+        self.settled = False
+        self.last = None if self.last is None else self.last._replace(time=0.0)
+
+    def mark_settled(self):
+        self.read(speeds=False, buffers=False)
+        self.settled = True
@@ -0,0 +1,187 @@
+"""
+REACH manipulator analog stick jogging
+
+The buttons move a tendon by a fixed motmov per press, which is coarse
+for the final alignment. While the deadman (the right trigger) is held,
+the analog sticks drive the tendons instead, at a speed proportional to
+how far the stick is pushed:
+
+    left stick  up/down       tendon 1
+    left stick  left/right    tendon 2
+    right stick up/down       tendon 3
+    right stick left/right    tendon 4
+
+Pushing up or right tightens. Readings inside the deadzone count as
+centred. A jog thread samples the sticks rate times a second and moves
+each commanded speed towards its target by at most accel/rate, so the
+motors ramp instead of stepping. Speeds are sent with SpeedM1/SpeedM2
+(SpeedM1M2 when both channels change) through the dispatch worker of
+the controller, and only when they change, so nothing is sent while the
+sticks are still. A tick is skipped for a controller whose last command
+has not gone out yet, instead of piling commands behind a button move.
+
+Releasing the deadman stops every jogged motor at once, without a
+ramp. So do stop() and any error in the jog thread.
+
+Usage:
+    sticks = StickJogger(controller, tendons, dispatch, controller_status, 36000, acc)
+    sticks.start()
+    ...
+    sticks.stop()       # returns once every jogged motor is stopped
+"""
+
+import threading
+import time
+
+from status import enc
+
+# Tendon -> (stick, axis, sign of the reading that tightens). The y axis
+# reads negative with the stick pushed up.
+STICKS = {
+    1: ("axis_l", "y", -1),
+    2: ("axis_l", "x", 1),
+    3: ("axis_r", "y", -1),
+    4: ("axis_r", "x", 1),
+}
+
+
+class StickJogger:
+    def __init__(self, controller, tendons, dispatch, controller_status, max_speed, accel,
+                 rate=50.0, deadzone=0.15, deadman="trigger_r", sticks=STICKS, on_speed=None):
+        self.controller = controller
+        self.tendons = tendons
+        self.dispatch = dispatch
+        self.controller_status = controller_status
+        self.max_speed = max_speed
+        self.accel = accel
+        self.rate = rate
+        self.deadzone = deadzone
+        self.deadman = deadman
+        self.sticks = {t: s for t, s in sticks.items() if t in tendons}
+        # on_speed(tendon, speed, encoders) after a speed was sent, with the
+        # encoder counts of the controller's tendons, from its worker
+        self.on_speed = on_speed
+
+        # Speeds in counts/s, positive tightens: ramped command, and the
+        # value last handed to the controller
+        self.command = {t: 0 for t in self.sticks}
+        self.sent = {t: 0 for t in self.sticks}
+        # Roboclaw -> Future of its last speed command
+        self.pending = {}
+        self.commands = 0
+        self.active = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def held(self):
+        return getattr(self.controller, self.deadman).value > 0.5
+
+    # Tendon -> target speed from the current stick deflection
+    def targets(self):
+        targets = {}
+        for tendon, (stick, axis, sign) in self.sticks.items():
+            value = sign*getattr(getattr(self.controller, stick), axis)
+            if abs(value) <= self.deadzone:
+                value = 0.0
+            else:
+                # Rescale so the speed starts from zero at the deadzone edge
+                scaled = min(1.0, (abs(value) - self.deadzone) / (1.0 - self.deadzone))
+                value = scaled if value > 0 else -scaled
+            targets[tendon] = int(value*self.max_speed)
+        return targets
+
+    # channels: motor -> (tendon, signed motor speed)
+    def _speed_cmd(self, rc, address, channels):
+        if len(channels) == 2:
+            rc.SpeedM1M2(address, channels[1][1], channels[2][1])
+        elif 1 in channels:
+            rc.SpeedM1(address, channels[1][1])
+        else:
+            rc.SpeedM2(address, channels[2][1])
+        status = self.controller_status[rc]
+        status.invalidate()
+        if self.on_speed is not None:
+            snap = status.read(speeds=False, buffers=False)
+            counts = {t: enc(snap, w[2]) for t, w in self.tendons.items() if w[0] is rc}
+            for tendon, speed in channels.values():
+                self.on_speed(tendon, speed*self.tendons[tendon][3], counts)
+
+    # Send every command that differs from what the controller last got
+    def flush(self):
+        by_rc = {}
+        for tendon, speed in self.command.items():
+            if speed == self.sent[tendon]:
+                continue
+            rc, address, motor, sign = self.tendons[tendon]
+            by_rc.setdefault(rc, (address, {}))[1][motor] = (tendon, sign*speed)
+        for rc, (address, channels) in by_rc.items():
+            last = self.pending.get(rc)
+            if last is not None and not last.done():
+                continue
+            for tendon, speed in channels.values():
+                self.sent[tendon] = self.command[tendon]
+            self.pending[rc] = self.dispatch.submit(rc, self._speed_cmd, rc, address, channels)
+            self.commands += 1
+
+    def halt(self):
+        for tendon in self.command:
+            self.command[tendon] = 0
+
+    # One control tick: ramp towards the sticks while the deadman is held
+    def update(self):
+        if self.held():
+            if not self.active:
+                print("[JOG] Deadman held, sticks drive the tendons")
+                self.active = True
+            step = self.accel / self.rate
+            for tendon, target in self.targets().items():
+                current = self.command[tendon]
+                self.command[tendon] = int(current + max(-step, min(step, target - current)))
+        else:
+            if self.active:
+                print("[JOG] Deadman released, jogged motors stopped")
+                self.active = False
+            self.halt()
+        self.flush()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sticks")
+        self._thread.start()
+
+    def _run(self):
+        period = 1.0 / self.rate
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.update()
+            except Exception as e:
+                print(f"[ERROR] Stick jogging stopped: {e}")
+                break
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+        self._stop.set()
+        self.halt()
+        self._drain()
+
+    # Wait for the in-flight commands, then make sure every motor got its stop
+    def _drain(self):
+        while True:
+            for future in list(self.pending.values()):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"[ERROR] Jog speed command failed: {e}")
+            if self.sent == self.command:
+                return
+            self.flush()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
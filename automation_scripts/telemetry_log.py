@@ -0,0 +1,140 @@
+"""
+REACH manipulator binary telemetry log
+
+Compact alternative to the load cell CSV for long unattended runs. The
+log is a memory-mapped file made of a small header followed by a fixed
+number of fixed-width records:
+
+    header (64 bytes, little endian)
+        magic        8s   b'REACHTLM'
+        version      u32
+        record_size  u32
+        capacity     u64  number of record slots
+        count        u64  records written so far
+    record (44 bytes, little endian)
+        timestamp    f64  monotonic seconds from start of logging
+        step         i32  step id from LoadCellSession.mark_step()
+        force        4 x f32  calibrated load cell forces
+        encoder      4 x i32  encoder counts for motors 1-4
+
+Records are appended in order; once capacity is reached the oldest
+slots are overwritten like a ring buffer. The slots are preallocated,
+and close() cuts a log that never filled them down to the records
+written, with capacity set to their count. The writer only needs the
+standard library so it can run on the rig, the reader needs NumPy.
+
+Usage:
+    log = TelemetryWriter('reach_telemetry.bin')
+    log.set_encoder(motor, count)               # from the motor checks
+    log.append(timestamp, step, forces)         # from the load cell callback
+    log.close()
+
+    data = read_telemetry('reach_telemetry.bin')
+    data['timestamp'], data['force'][:, 0], data['encoder'][:, 3]
+"""
+
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b'REACHTLM'
+VERSION = 1
+HEADER_FORMAT = '<8sIIQQ'
+HEADER_SIZE = 64
+RECORD_FORMAT = '<di4f4i'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+CAPACITY_OFFSET = struct.calcsize('<8sII')
+COUNT_OFFSET = struct.calcsize('<8sIIQ')
+
+
+class TelemetryWriter:
+    def __init__(self, path, capacity=1 << 21):
+        self.path = path
+        self.capacity = capacity
+        self.count = 0
+        self.encoders = [0, 0, 0, 0]
+        self.lock = threading.Lock()
+
+        size = HEADER_SIZE + capacity * RECORD_SIZE
+        self._file = open(path, 'w+b')
+        self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        struct.pack_into(HEADER_FORMAT, self._mm, 0,
+                         MAGIC, VERSION, RECORD_SIZE, capacity, 0)
+
+    # Latest encoder count for motor 1-4, stored with every following record
+    def set_encoder(self, motor, count):
+        self.encoders[motor - 1] = count
+
+    def append(self, timestamp, step, forces, encoders=None):
+        if encoders is None:
+            encoders = self.encoders
+        with self.lock:
+            if self._mm is None:
+                return
+            offset = HEADER_SIZE + (self.count % self.capacity) * RECORD_SIZE
+            struct.pack_into(RECORD_FORMAT, self._mm, offset,
+                             timestamp, step, *forces, *encoders)
+            self.count += 1
+            struct.pack_into('<Q', self._mm, COUNT_OFFSET, self.count)
+
+    def close(self):
+        with self.lock:
+            if self._mm is None:
+                return
+            used = min(self.count, self.capacity)
+            if used < self.capacity:
+                struct.pack_into('<Q', self._mm, CAPACITY_OFFSET, used)
+            self._mm.flush()
+            self._mm.close()
+            self._mm = None
+            # Drop the slots that were never written
+            self._file.truncate(HEADER_SIZE + used * RECORD_SIZE)
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def record_dtype():
+    import numpy as np
+    return np.dtype([('timestamp', '<f8'), ('step', '<i4'),
+                     ('force', '<f4', (4,)), ('encoder', '<i4', (4,))])
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        magic, version, record_size, capacity, count = struct.unpack(
+            HEADER_FORMAT, f.read(struct.calcsize(HEADER_FORMAT)))
+    if magic != MAGIC:
+        raise ValueError(path + " is not a REACH telemetry log")
+    if version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError("Unsupported telemetry log version %d" % version)
+    return capacity, count
+
+
+# Returns a structured array of the records in write order. The result is
+# a read-only view of the memory-mapped file unless the ring has wrapped,
+# in which case the two halves are joined into a copy.
+def read_telemetry(path):
+    import numpy as np
+    capacity, count = read_header(path)
+    if count == 0:
+        return np.zeros(0, dtype=record_dtype())
+    records = np.memmap(path, dtype=record_dtype(), mode='r',
+                        offset=HEADER_SIZE, shape=(capacity,))
+    if count <= capacity:
+        return records[:count]
+    head = count % capacity
+    return np.concatenate((records[head:], records[:head]))
+
+
+def is_telemetry_log(path):
+    if os.path.getsize(path) < HEADER_SIZE:
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
@@ -0,0 +1,239 @@
+"""
+REACH manipulator manual session recording and replay
+
+Every manual command (a button or key step, a stick or key speed
+change) is appended to a JSON lines session file with the time since
+the session started and the encoder count of every tendon when it was
+sent. The first line holds the sign that tightens each tendon and the
+starting encoders, the last line the encoders when recording stopped.
+Distances and speeds are recorded positive to tighten.
+
+A session is replayed either at its original timing, with the speed
+commands sent when they were recorded, or compressed: the dwell
+between commands is dropped, every speed segment becomes the distance
+the encoders say it covered, adjacent moves of the same tendon are
+merged, and the result runs as coordinated moves, so a configuration
+found by hand is reached again in a fraction of the time. Replays are
+relative to where the rig starts, as the recorded encoder counts are.
+
+Usage:
+    recorder = SessionRecorder('reach_manual.jsonl', tendons, encoders=read_encoders)
+    recorder.move(1, motmov)
+    recorder.speed(3, -36000)
+    recorder.close()
+
+    python teleop_session.py reach_manual.jsonl [--original] [--sim]
+"""
+
+import json
+import sys
+import threading
+import time
+
+from sequences import Move, vectors
+from status import enc
+
+
+class SessionRecorder:
+    # encoders() returns {tendon: count}, used when a command brings none
+    def __init__(self, path, tendons, encoders=None):
+        self.path = path
+        self.encoders = encoders
+        self.pose = {}
+        self.commands = 0
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self._file = open(path, 'w')
+        self._write({"type": "session", "t": 0.0, "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+                     "tighten": {str(t): w[3] for t, w in sorted(tendons.items())},
+                     "encoders": self._snapshot()})
+
+    # Full pose, counts given for some tendons update the last known ones
+    def _snapshot(self, counts=None):
+        if counts is None and self.encoders is not None:
+            counts = self.encoders()
+        self.pose.update(counts or {})
+        return {str(t): c for t, c in sorted(self.pose.items())}
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def _record(self, record, encoders):
+        with self.lock:
+            if self._file is None:
+                return
+            record["t"] = round(time.monotonic() - self.start, 4)
+            record["encoders"] = self._snapshot(encoders)
+            self._write(record)
+            self.commands += 1
+
+    def move(self, tendon, distance, encoders=None):
+        self._record({"type": "move", "tendon": tendon, "distance": distance}, encoders)
+
+    def speed(self, tendon, speed, encoders=None):
+        self._record({"type": "speed", "tendon": tendon, "speed": speed}, encoders)
+
+    def close(self):
+        with self.lock:
+            if self._file is None:
+                return
+            self._write({"type": "end", "t": round(time.monotonic() - self.start, 4),
+                         "encoders": self._snapshot()})
+            self._file.close()
+            self._file = None
+        print(f"[SESSION] {self.commands} manual commands recorded to {self.path}")
+
+
+# (header, commands, end) of a session file. A session cut short has no
+# end line; its last command stands in for it.
+def load(path):
+    header, commands, end = None, [], None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            record["encoders"] = {int(t): c for t, c in record.get("encoders", {}).items()}
+            if record["type"] == "session":
+                header = record
+                header["tighten"] = {int(t): s for t, s in record["tighten"].items()}
+            elif record["type"] == "end":
+                end = record
+            else:
+                commands.append(record)
+    if header is None:
+        raise ValueError("%s is not a session file" % path)
+    if end is None:
+        end = commands[-1] if commands else header
+    return header, commands, end
+
+
+# Distance each tendon moved, tightening positive, between two poses
+def travel(header, before, after):
+    return {t: (after[t] - before[t])*s for t, s in header["tighten"].items()
+            if t in before and t in after}
+
+
+# Compressed session: a list of coordinated move vectors {tendon: distance}
+def compress(session, min_distance=100):
+    header, commands, end = session
+    moves = []
+    for i, command in enumerate(commands):
+        tendon = command["tendon"]
+        if command["type"] == "move":
+            distance = command["distance"]
+        else:
+            # A speed holds until the next command to the same tendon
+            later = [c for c in commands[i + 1:] if c["tendon"] == tendon]
+            after = later[0]["encoders"] if later else end["encoders"]
+            distance = travel(header, command["encoders"], after).get(tendon, 0)
+        if moves and moves[-1][0] == tendon:
+            moves[-1][1] += distance
+        else:
+            moves.append([tendon, distance])
+    kept = [Move(0, 'manual', step, tendon, distance)
+            for step, (tendon, distance) in enumerate(moves) if abs(distance) >= min_distance]
+    return vectors(kept)
+
+
+# encoders() that reads on the dispatch workers, safe from any thread
+def worker_encoders(tendons, controller_status, dispatch):
+    def read():
+        pose = {}
+        for rc, status in controller_status.items():
+            snap = dispatch.call(rc, status.encoders)
+            pose.update({t: enc(snap, w[2]) for t, w in tendons.items() if w[0] is rc})
+        return pose
+    return read
+
+
+# send_speed(tendon, speed) for speed commands, through the dispatch workers
+def speed_sender(tendons, controller_status, dispatch):
+    def send(tendon, speed):
+        rc, address, motor, sign = tendons[tendon]
+
+        def cmd():
+            if motor == 1:
+                rc.SpeedM1(address, sign*speed)
+            else:
+                rc.SpeedM2(address, sign*speed)
+            controller_status[rc].invalidate()
+
+        dispatch.call(rc, cmd)
+    return send
+
+
+def replay(session, mover, send_speed, compressed=True):
+    header, commands, end = session
+    start = time.monotonic()
+    if compressed:
+        plan = compress(session)
+        print(f"[REPLAY] {len(commands)} commands compressed to {len(plan)} moves")
+        for deltas in plan:
+            mover.move(deltas)
+    else:
+        print(f"[REPLAY] {len(commands)} commands at the recorded timing ({end['t']:.1f} s)")
+        running = set()
+        for command in commands:
+            delay = start + command["t"] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if command["type"] == "move":
+                mover.move({command["tendon"]: command["distance"]})
+            else:
+                send_speed(command["tendon"], command["speed"])
+                running.add(command["tendon"])
+        # A session cut short can end with a motor still running
+        for tendon in running:
+            send_speed(tendon, 0)
+    return time.monotonic() - start
+
+
+def main():
+    import sim
+    # Swap in the simulated rig before any hardware module is imported (--sim)
+    sim.install_if_requested()
+    import hardware
+    from roboclaw_dispatch import Dispatcher
+    from status import ControllerStatus
+    from coordinated import CoordinatedMover
+    import home
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if not args:
+        print("Usage: python teleop_session.py session.jsonl [--original] [--sim]")
+        sys.exit(1)
+    session = load(args[0])
+    compressed = '--original' not in sys.argv
+
+    rig = hardware.connect(hardware.load_profile())
+    dispatch = Dispatcher()
+    controller_status = {}
+    for name in rig.controllers:
+        rc, address = rig.controller(name)
+        dispatch.add(rc, name)
+        controller_status[rc] = ControllerStatus(rc, address)
+    mover = CoordinatedMover(rig.tendons, controller_status, dispatch, rig.spd, rig.acc)
+
+    try:
+        before = home.capture(rig.tendons, controller_status)
+        elapsed = replay(session, mover, speed_sender(rig.tendons, controller_status, dispatch),
+                         compressed=compressed)
+        dispatch.barrier()
+        time.sleep(0.25)
+        reached = home.capture(rig.tendons, controller_status)
+    finally:
+        dispatch.shutdown(wait=False)
+
+    header, commands, end = session
+    recorded = travel(header, header["encoders"], end["encoders"])
+    replayed = travel(header, before, reached)
+    error = max((abs(replayed[t] - d) for t, d in recorded.items() if t in replayed), default=0)
+    print(f"[REPLAY] Done in {elapsed:.1f} s (recorded {end['t']:.1f} s), "
+          f"largest difference from the recorded travel {error} counts")
+
+
+if __name__ == "__main__":
+    main()
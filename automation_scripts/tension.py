@@ -0,0 +1,167 @@
+"""
+REACH manipulator tension regulation
+
+Closed-loop replacement for side_tendons_slack. A regulator thread
+reads the four calibrated load cell forces at control_rate and keeps
+every tendon that is not driving the current step inside a band around
+the force it had when the run started (the aligned, balanced pose). A
+tendon more than band above it is loosened. With a floor set, a tendon
+more than floor below it is tightened; by default the sequence's own
+loosening is left alone, as side_tendons_slack only ever loosened.
+Corrections are counts_per_unit per unit of force outside the band,
+limited to max_correction counts. Tendons inside the band are left
+alone, so no command is sent while the tensions stay where they should.
+
+Corrections go through the dispatch worker of the tendon's controller,
+so they run between the moves of the sequence and never share a serial
+port with them. A correction job waits until the tendon has finished
+moving, so the sequence's next move on that controller cannot cut it
+short, and the tendon gets no new correction until the last one has
+landed. on_correction hears of every correction once it has landed,
+with the encoder change it made, so the run journal can account for
+it.
+
+Usage:
+    regulator = TensionRegulator(session, tendons, controller_status, dispatch, spd, acc)
+    regulator.start()
+    run_program(..., on_step=regulator.set_step)
+    regulator.stop()
+    regulator.report()
+"""
+
+import threading
+import time
+
+from balance import tendon_forces
+from motion import wait_for_completion
+from status import enc
+
+
+class TensionRegulator:
+    def __init__(self, session, tendons, controller_status, dispatch, spd, acc, band=1.5,
+                 floor=None, control_rate=5.0, counts_per_unit=2000, max_correction=2880,
+                 min_correction=200, settle_time=0.25, timeout=10, on_correction=None):
+        self.session = session
+        self.tendons = tendons
+        self.controller_status = controller_status
+        self.dispatch = dispatch
+        self.spd = spd
+        self.acc = acc
+        self.band = band
+        self.floor = floor
+        self.control_rate = control_rate
+        self.counts_per_unit = counts_per_unit
+        self.max_correction = max_correction
+        self.min_correction = min_correction
+        self.settle_time = settle_time
+        self.timeout = timeout
+        # on_correction(tendon, encoder change, encoder count) once a
+        # correction has landed, from the worker of its controller
+        self.on_correction = on_correction
+
+        self.baseline = None
+        self.driving = set()
+        self.corrections = 0
+        self.corrected_counts = 0
+        self.peak = {}
+        # tendon -> Future of its last correction, done once the tendon stopped
+        self.pending = {}
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Tendons the step about to run tightens overall are left to the sequence
+    def set_step(self, moves):
+        net = {}
+        for m in moves:
+            net[m.tendon] = net.get(m.tendon, 0) + m.distance
+        with self.lock:
+            self.driving = {t for t, d in net.items() if d > 0}
+
+    def start(self):
+        self.baseline = tendon_forces(self.session)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="tension")
+        self._thread.start()
+
+    # Returns once the corrections already sent have landed
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for future in list(self.pending.values()):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"[ERROR] Tension correction failed: {e}")
+
+    def _correct(self, tendon, counts):
+        rc, address, motor, sign = self.tendons[tendon]
+        status = self.controller_status[rc]
+        speed = sign*self.acc if counts > 0 else -sign*self.acc
+
+        def run():
+            status.invalidate()
+            before = enc(status.read(speeds=False, buffers=False), motor)
+            if motor == 1:
+                rc.SpeedAccelDistanceM1(address, self.spd, speed, abs(counts), 1)
+            else:
+                rc.SpeedAccelDistanceM2(address, self.spd, speed, abs(counts), 1)
+            wait_for_completion(status, motor, settle_time=self.settle_time,
+                                timeout=self.timeout)
+            if self.on_correction is not None:
+                after = enc(status.encoders(), motor)
+                self.on_correction(tendon, after - before, after)
+
+        self.pending[tendon] = self.dispatch.submit(rc, run)
+        self.corrections += 1
+        self.corrected_counts += abs(counts)
+
+    # One control tick: correct every non-driving tendon outside its band
+    def update(self):
+        forces = tendon_forces(self.session)
+        with self.lock:
+            driving = set(self.driving)
+        for tendon, force in forces.items():
+            base = self.baseline.get(tendon)
+            if base is None:
+                continue
+            self.peak[tendon] = max(self.peak.get(tendon, force), force)
+            if tendon in driving:
+                continue
+            # Wait for the last correction to land before judging it
+            if tendon in self.pending and not self.pending[tendon].done():
+                continue
+            # Force outside the band, positive if the tendon is too slack
+            if force > base + self.band:
+                error = base + self.band - force
+            elif self.floor is not None and force < base - self.floor:
+                error = base - self.floor - force
+            else:
+                continue
+            counts = int(error*self.counts_per_unit)
+            counts = max(-self.max_correction, min(self.max_correction, counts))
+            if abs(counts) >= self.min_correction:
+                self._correct(tendon, counts)
+
+    def _run(self):
+        period = 1.0 / self.control_rate
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            self.update()
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+
+    # slack_commands: what side_tendons_slack would have sent, for comparison
+    def report(self, slack_commands=None):
+        peaks = ", ".join("%d: %.2f" % (t, f) for t, f in sorted(self.peak.items()))
+        line = (f"[TENSION] {self.corrections} corrections ({self.corrected_counts} counts), "
+                f"peak forces {peaks}")
+        if slack_commands is not None:
+            line += f"; side_tendons_slack would have sent {slack_commands} commands"
+        print(line)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The automation scripts import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sim
+
+# The simulated rig stands in for roboclaw_3, Phidget22 and the Xbox
+# controller before any test imports a hardware module
+sim.install()
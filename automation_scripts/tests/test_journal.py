@@ -0,0 +1,123 @@
+import pytest
+
+import journal
+from sequences import Move
+
+# Tendon -> (rc, address, motor, sign that tightens), only the sign is used
+TENDONS = {1: (None, 0x80, 2, 1), 2: (None, 0x80, 1, -1)}
+
+PROGRAM = [
+    Move('M1', 'out', 0, 1, 11520),
+    Move('M1', 'out', 0, 2, 11520),
+    Move('M1', 'out', 1, 1, 11520),
+    Move('M1', 'back', 2, 1, -23040),
+]
+
+
+class Rig:
+    def __init__(self):
+        self.pose = {1: 0, 2: 0}
+
+    def encoders(self):
+        return dict(self.pose)
+
+    def run(self, moves):
+        for m in moves:
+            self.pose[m.tendon] += m.distance*TENDONS[m.tendon][3]
+
+
+def by_step(program):
+    groups = {}
+    for m in program:
+        groups.setdefault(m.step, []).append(m)
+    return [groups[s] for s in sorted(groups)]
+
+
+@pytest.fixture
+def rig():
+    return Rig()
+
+
+def record(path, rig, steps, interrupt_after=None):
+    j = journal.RunJournal(path, encoders=rig.encoders, tendons=TENDONS)
+    j.start(PROGRAM, rig.encoders())
+    for i, moves in enumerate(steps):
+        j.begin(moves)
+        rig.run(moves)
+        if i == interrupt_after:
+            break
+        j.commit(moves)
+    j.close()
+
+
+def test_resume_after_the_last_committed_step(tmp_path, rig):
+    path = str(tmp_path / 'journal.jsonl')
+    record(path, rig, by_step(PROGRAM)[:2])
+    state = journal.load(path)
+    assert state["last_step"] == 1
+    assert journal.check(state, PROGRAM, rig.encoders()) == []
+    assert [m.step for m in journal.remaining(PROGRAM, state)] == [2]
+
+
+def test_step_finished_after_the_interruption_is_recovered(tmp_path, rig):
+    path = str(tmp_path / 'journal.jsonl')
+    record(path, rig, by_step(PROGRAM), interrupt_after=1)
+    state = journal.load(path)
+    assert state["last_step"] == 0
+    assert state["pending"]["steps"] == [1]
+    assert journal.check(state, PROGRAM, rig.encoders()) == []
+    assert state["recovered"]["steps"] == [1]
+    assert [m.step for m in journal.remaining(PROGRAM, state)] == [2]
+
+
+def test_pose_matching_neither_step_is_refused(tmp_path, rig):
+    path = str(tmp_path / 'journal.jsonl')
+    record(path, rig, by_step(PROGRAM)[:2])
+    pose = rig.encoders()
+    pose[1] += 5000
+    problems = journal.check(journal.load(path), PROGRAM, pose)
+    assert len(problems) == 1 and "motor 1" in problems[0]
+
+
+def test_other_program_is_refused(tmp_path, rig):
+    path = str(tmp_path / 'journal.jsonl')
+    record(path, rig, by_step(PROGRAM)[:1])
+    problems = journal.check(journal.load(path), PROGRAM[:-1], rig.encoders())
+    assert problems and "sequence differs" in problems[0]
+
+
+def test_corrections_shift_the_committed_pose_and_the_target(tmp_path, rig):
+    path = str(tmp_path / 'journal.jsonl')
+    j = journal.RunJournal(path, encoders=rig.encoders, tendons=TENDONS)
+    j.start(PROGRAM, rig.encoders())
+    first, second = by_step(PROGRAM)[:2]
+    j.begin(first)
+    rig.run(first)
+    j.commit(first)
+    # A correction between steps, then one while the next step runs
+    rig.pose[2] += 300
+    j.correction(2, 300, rig.pose[2])
+    j.begin(second)
+    rig.run(second)
+    rig.pose[2] -= 250
+    j.correction(2, -250, rig.pose[2])
+    j.close()
+
+    state = journal.load(path)
+    assert state["encoders"][2] == rig.pose[2]
+    assert state["pending"]["target"] == rig.encoders()
+    assert journal.check(state, PROGRAM, rig.encoders()) == []
+    assert state["last_step"] == 1
+
+
+def test_reopen_commits_the_recovered_step(tmp_path, rig):
+    path = str(tmp_path / 'journal.jsonl')
+    record(path, rig, by_step(PROGRAM), interrupt_after=1)
+    state = journal.load(path)
+    journal.check(state, PROGRAM, rig.encoders())
+    j = journal.RunJournal(path, encoders=rig.encoders, tendons=TENDONS)
+    j.reopen(state)
+    j.close()
+    reloaded = journal.load(path)
+    assert reloaded["last_step"] == 1
+    assert reloaded["pending"] is None
@@ -0,0 +1,73 @@
+import pytest
+
+import sim
+from link import LinkError, WatchedRoboclaw
+from status import ControllerStatus
+
+ADDRESS = 0x80
+
+
+@pytest.fixture
+def link():
+    rc = sim.FakeRoboclaw("/dev/ttyACM0", 460800)
+    rc.Open()
+
+    def reopen(rc):
+        rc.Open()
+        return rc.comport
+    return WatchedRoboclaw(rc, ADDRESS, reopen, name="rc1", reconnect_delay=0)
+
+
+def drop(link, reset):
+    rc = link.rc
+    rc.dropped = True
+    if reset:
+        for channel in rc.channels.values():
+            channel.set_position(0)
+
+
+def test_reset_controller_gets_its_encoders_back(link):
+    link.SetEncM1(ADDRESS, 50000)
+    link.SetEncM2(ADDRESS, -30000)
+    assert link.ReadEncoders(ADDRESS)[1:] == (50000, -30000)
+    drop(link, reset=True)
+    ok, enc1, enc2 = link.ReadEncoders(ADDRESS)
+    assert ok and (enc1, enc2) == (50000, -30000)
+    assert link.health.reconnects == 1
+    assert link.health.resyncs == 2
+
+
+def test_counts_that_moved_on_are_not_rolled_back(link):
+    link.SetEncM1(ADDRESS, 50000)
+    link.SetEncM2(ADDRESS, -30000)
+    link.ReadEncoders(ADDRESS)
+    # The motors kept moving while the link was down, no reset
+    link.rc.channel(ADDRESS, 1).set_position(61520)
+    link.rc.channel(ADDRESS, 2).set_position(-18480)
+    drop(link, reset=False)
+    assert link.ReadEncoders(ADDRESS)[1:] == (61520, -18480)
+    assert link.health.resyncs == 0
+
+
+def test_near_zero_counts_are_not_taken_for_a_reset(link):
+    link.SetEncM1(ADDRESS, 1000)
+    link.ReadEncoders(ADDRESS)
+    drop(link, reset=True)
+    assert link.ReadEncoders(ADDRESS)[1] == 0
+    assert link.health.resyncs == 0
+
+
+def test_reconnect_drops_the_status_cache(link):
+    status = ControllerStatus(link, ADDRESS)
+    status.mark_settled()
+    drop(link, reset=False)
+    link.ReadEncoders(ADDRESS)
+    assert not status.settled
+
+
+def test_link_that_never_comes_back_raises(link):
+    link.reopen = lambda rc: None
+    link.reconnect_attempts = 2
+    drop(link, reset=False)
+    with pytest.raises(LinkError):
+        link.ReadEncoders(ADDRESS)
@@ -0,0 +1,57 @@
+from loadcells import SampleAligner
+
+
+def aligner(rows, channels=2, interval=0.01):
+    return SampleAligner(channels, interval, lambda t, step, forces: rows.append((t, step, forces)))
+
+
+def test_row_once_every_channel_reported():
+    rows = []
+    a = aligner(rows)
+    a.add(0.001, 0, 0, 1.0)
+    assert rows == []
+    a.add(0.002, 0, 1, 2.0)
+    assert rows == [(0.0, 0, [1.0, 2.0])]
+
+
+def test_no_row_before_every_channel_has_a_value():
+    rows = []
+    a = aligner(rows)
+    a.add(0.001, 0, 0, 1.0)
+    # The next tick closes the first one, channel 1 never reported
+    a.add(0.011, 0, 0, 1.5)
+    assert rows == []
+
+
+def test_missed_channel_repeats_its_last_value():
+    rows = []
+    a = aligner(rows)
+    a.add(0.001, 0, 0, 1.0)
+    a.add(0.002, 0, 1, 2.0)
+    a.add(0.011, 0, 0, 1.5)
+    a.add(0.021, 0, 0, 1.7)
+    assert rows[1] == (0.01, 0, [1.5, 2.0])
+
+
+def test_closed_tick_keeps_its_own_step():
+    rows = []
+    a = aligner(rows)
+    a.add(0.001, 3, 0, 1.0)
+    a.add(0.002, 3, 1, 2.0)
+    a.add(0.011, 3, 0, 1.5)
+    # First sample of the next step closes the tick of step 3
+    a.add(0.021, 4, 0, 1.7)
+    assert rows[-1] == (0.01, 3, [1.5, 2.0])
+    a.add(0.022, 4, 1, 2.2)
+    assert rows[-1] == (0.02, 4, [1.7, 2.2])
+
+
+def test_reset_forgets_the_previous_values():
+    rows = []
+    a = aligner(rows)
+    a.add(0.001, 0, 0, 1.0)
+    a.add(0.002, 0, 1, 2.0)
+    a.reset()
+    a.add(0.011, 1, 0, 1.5)
+    a.add(0.021, 1, 0, 1.7)
+    assert len(rows) == 1
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from sequences import compile_sequence, load_sequence, optimize, steps, vectors
+
+SEQUENCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'workspace_sequence.json')
+
+
+def net(moves):
+    totals = {}
+    for m in moves:
+        totals[(m.step, m.tendon)] = totals.get((m.step, m.tendon), 0) + m.distance
+    return {k: d for k, d in totals.items() if d}
+
+
+@pytest.fixture(params=[(5, 11520, True, 4), (5, 46080, False, None), (2, 11520, True, 1)])
+def program(request):
+    path, motmov, alternate, slack = request.param
+    return compile_sequence(load_sequence(SEQUENCE), path, motmov, alternate=alternate,
+                            side_tendons_slack=slack)
+
+
+def test_optimize_keeps_the_net_move_of_every_step(program):
+    assert net(optimize(program)) == net(program)
+
+
+def test_optimize_leaves_kept_moves_alone(program):
+    kept = [m for m in program if m.keep]
+    assert [m for m in optimize(program) if m.keep] == kept
+
+
+def test_optimize_never_grows_the_program(program):
+    optimized = optimize(program)
+    assert len(optimized) <= len(program)
+    assert optimize(optimized) == optimized
+
+
+def test_vectors_cover_each_step_in_order(program):
+    for group in steps(optimize(program)):
+        split = vectors(group)
+        assert all(split)
+        flattened = [(t, d) for deltas in split for t, d in deltas.items()]
+        assert sorted(flattened) == sorted((m.tendon, m.distance) for m in group)
+        # A tendon moving twice in a step starts a new vector
+        for previous, deltas in zip(split, split[1:]):
+            first = next(iter(deltas))
+            assert first in previous
+
+
+def test_steps_are_numbered_in_order(program):
+    numbers = [group[0].step for group in steps(program)]
+    assert numbers == sorted(numbers)
+    assert len(set(numbers)) == len(numbers)
@@ -1,15 +1,23 @@
 from Phidget22.Phidget import *
 from Phidget22.Devices.VoltageRatioInput import *
 import time
+import os
+import sys
 
-gain0 = 56230
-offset0 = 2.8131
-gain1 = 56251
-offset1 = 5.1885
-gain2 = 56145
-offset2 = 0.3451
-gain3 = 56145
-offset3 = 1.2198
+# The load cell session and the hardware profile come from the automation scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'automation_scripts'))
+from loadcells import LoadCellSession
+import hardware
+
+# --max-rate runs every bridge at its fastest data interval and reports every
+# sample (change trigger 0); samples are counted instead of printed and the
+# measured rate is shown once a second
+max_rate = '--max-rate' in sys.argv
+
+# Calibration from the hardware profile
+profile = hardware.load_profile()
+gain0, gain1, gain2, gain3 = profile["load_cells"]["gains"]
+offset0, offset1, offset2, offset3 = profile["load_cells"]["offsets"]
 #calibrated = False
 
 
@@ -33,6 +41,24 @@ def onVoltageRatioInput3_VoltageRatioChange(self, voltageRatio):
 	weight3 = voltageRatio*gain3 - offset3 #weight = (voltageRatio - offset0)*gain0
 	print("Force [3]: " + str(weight3))
 
+def main_max_rate():
+	session = LoadCellSession([gain0, gain1, gain2, gain3], [offset0, offset1, offset2, offset3],
+		data_interval='max', change_trigger=0)
+	session.open()
+	session.report(session.measure_rates())
+	print("Ctrl-C to Stop")
+	try:
+		while True:
+			rates = session.measure_rates()
+			forces = session.forces()
+			# A channel with no reading yet keeps its column
+			print("Rate [Hz]: " + " ".join("%6.0f" % r for r in rates)
+				+ "   Force: " + " ".join("%8.3f" % f if f is not None else "%8s" % "---" for f in forces))
+	except KeyboardInterrupt:
+		pass
+	finally:
+		session.close()
+
 def main():
 	#Create your Phidget channels
 	voltageRatioInput0 = VoltageRatioInput()
@@ -71,4 +97,7 @@ def main():
 	voltageRatioInput2.close()
 	voltageRatioInput3.close()
 
-main()
\ No newline at end of file
+if max_rate:
+	main_max_rate()
+else:
+	main()
@@ -2,27 +2,37 @@
 
 import matplotlib.pyplot as plt
 import csv
+import os
+import sys
 
-y0, y1, y2, y3 = [], [], [], []
-with open('path1_1.csv','r') as csvfile:
-	lines = csv.reader(csvfile, delimiter=',')
-	for row in lines:
-		y0.append(float(row[0]))
-		y1.append(float(row[1]))
-		y2.append(float(row[2]))
-		y3.append(float(row[3]))
+# Binary telemetry logs are read with the reader from the automation scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'automation_scripts'))
+from telemetry_log import is_telemetry_log, read_telemetry
+
+
+def load_forces(path):
+	# Telemetry logs come back as zero-copy NumPy columns
+	if is_telemetry_log(path):
+		force = read_telemetry(path)['force']
+		return force[:, 0], force[:, 1], force[:, 2], force[:, 3]
+
+	f0, f1, f2, f3 = [], [], [], []
+	with open(path,'r') as csvfile:
+		lines = csv.reader(csvfile, delimiter=',')
+		for row in lines:
+			f0.append(float(row[0]))
+			f1.append(float(row[1]))
+			f2.append(float(row[2]))
+			f3.append(float(row[3]))
+	return f0, f1, f2, f3
+
+
+y0, y1, y2, y3 = load_forces('path1_1.csv')
 
 x1 = list(range(len(y0))) #316 for the first one, 181 for second
 size1 = len(y0) - 1
 
-y4, y5, y6, y7 = [], [], [], []
-with open('path1_2.csv','r') as csvfile:
-	lines = csv.reader(csvfile, delimiter=',')
-	for row in lines:
-		y4.append(float(row[0]))
-		y5.append(float(row[1]))
-		y6.append(float(row[2]))
-		y7.append(float(row[3]))
+y4, y5, y6, y7 = load_forces('path1_2.csv')
 
 x2 = list(range(len(y4))) #316 for the first one, 181 for second
 size2 = len(y4) - 1
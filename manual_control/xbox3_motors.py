@@ -1,89 +1,155 @@
+"""
+REACH manipulator keyboard teleoperation
+
+Arrow keys drive motors 1 and 2, WASD motors 3 and 4. Keyboard hooks
+keep track of which of the eight keys are held; a motor runs at
+jog_speed while its key is down and stops when it is released, and any
+number of motors on both controllers can run at once. A command thread
+sends the speeds every tick, only to the controllers whose commanded
+speeds changed, so nothing is sent while the keys stay as they are.
+
+Every command is recorded with its time and the encoder counts to a
+session file, which teleop_session.py replays at the recorded timing
+or compressed.
+
+Usage:
+    python xbox3_motors.py          continuous jogging while keys are held
+    python xbox3_motors.py --step   one motmov move per key press
+"""
+
+import os
 import signal
+import sys
+import threading
 import keyboard
 import time
-from roboclaw_3 import Roboclaw
 
+# The hardware profile and its loader live with the automation scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'automation_scripts'))
+import hardware
+import home
+from status import ControllerStatus
+from teleop_session import SessionRecorder
 
-baudrate = 38400#230400
 
-rc = Roboclaw("/dev/ttyACM1", baudrate)
-rc2 = Roboclaw("/dev/ttyACM0", baudrate)
+# Ports, baud rate, addresses and speeds come from the hardware profile
+rig = hardware.connect(hardware.load_profile())
+tendons = rig.tendons
+controller_status = {}
+for name in rig.controllers:
+    rc, address = rig.controller(name)
+    controller_status[rc] = ControllerStatus(rc, address)
 
-rc.Open()
-add1 = 0x81
-rc2.Open()
-add2 = 0x80
+spd = rig.spd
+acc = rig.acc
+motmov = rig.motmov
 
+# Speed of a held key in counts/s, and how often the speeds are sent
+jog_speed = 36000
+tick = 0.05
+step_mode = '--step' in sys.argv
 
-spd = 144000
-acc = 144000
-motmov = 46080#92160#184320/2
+# Session file for teleop_session.py
+session_file = time.strftime('manual_session_%Y%m%d_%H%M%S.jsonl')
+
+# Key -> (motor, +1 tightens / -1 loosens)
+KEYS = {
+    'up': (1, 1), 'down': (1, -1),
+    'left': (2, 1), 'right': (2, -1),
+    'w': (3, 1), 's': (3, -1),
+    'a': (4, 1), 'd': (4, -1),
+}
+
+held = set()
+held_lock = threading.Lock()
+stop = threading.Event()
 
-# rc.SpeedAccelDistanceM1(add1, 144000, 144000,200000,1)
-# rc.SpeedAccelDistanceM2(add1, 144000, 144000,200000,1)
-# rc.SpeedAccelDistanceM1(add2, 144000, 144000,200000,1)
-# rc.SpeedAccelDistanceM2(add2, 144000, 144000,200000,1)
 
 def move_motor(key):
-    global add1, add2, motmov, acc, spd
-
-    if key == 'up':
-        rc.SpeedAccelDistanceM2(add1, spd, acc, motmov, 1)
-        print("Motor 1 Plus")
-    elif key == 'down':
-        rc.SpeedAccelDistanceM2(add1, spd, -acc, motmov, 1)
-        print("Motor 1 Minus")
-    elif key == 'left':
-        rc.SpeedAccelDistanceM1(add1, spd, -acc, motmov, 1)
-        print("Motor 2 Plus")
-    elif key == 'right':
-        rc.SpeedAccelDistanceM1(add1, spd, acc, motmov, 1)
-        print("Motor 2 Minus")
-    elif key == 'w':
-        rc2.SpeedAccelDistanceM1(add2, spd, -acc, motmov, 1)
-        print("Motor 3 Plus")
-    elif key == 's':
-        rc2.SpeedAccelDistanceM1(add2, spd, acc, motmov, 1)
-        print("Motor 3 Minus")
-    elif key == 'a':
-        rc2.SpeedAccelDistanceM2(add2, spd, acc, motmov, 1)
-        print("Motor 4 Plus")
-    elif key == 'd':
-        rc2.SpeedAccelDistanceM2(add2, spd, -acc, motmov, 1)
-        print("Motor 4 Minus")
+    tendon, direction = KEYS[key]
+    rc, address, channel, sign = tendons[tendon]
+    recorder.move(tendon, direction*motmov)
+    if channel == 1:
+        rc.SpeedAccelDistanceM1(address, spd, sign*direction*acc, motmov, 1)
+    else:
+        rc.SpeedAccelDistanceM2(address, spd, sign*direction*acc, motmov, 1)
+    print("Motor %d %s" % (tendon, "Plus" if direction > 0 else "Minus"))
+
+
+# Hook callbacks only record the key state. Auto-repeat reports a held
+# key again, so a step move is made on the first press only.
+def key_down(key):
+    with held_lock:
+        repeat = key in held
+        held.add(key)
+    if step_mode and not repeat:
+        move_motor(key)
+
+
+def key_up(key):
+    with held_lock:
+        held.discard(key)
+
+
+# Motor -> speed from the held keys, opposite keys cancel
+def commanded():
+    speeds = {tendon: 0 for tendon in tendons}
+    with held_lock:
+        keys = set(held)
+    for key in keys:
+        tendon, direction = KEYS[key]
+        speeds[tendon] += direction*jog_speed
+    return speeds
+
+
+def send_speeds(speeds):
+    # One packet per controller, both channels at once
+    by_rc = {}
+    for tendon, speed in speeds.items():
+        rc, address, channel, sign = tendons[tendon]
+        by_rc.setdefault(rc, [address, 0, 0])[channel] = sign*speed
+    for rc, (address, m1, m2) in by_rc.items():
+        rc.SpeedAccelM1M2(address, acc, m1, m2)
+
+
+# The only thread that talks to the controllers in continuous mode
+def stream():
+    sent = {tendon: 0 for tendon in tendons}
+    while not stop.is_set():
+        speeds = commanded()
+        changed = {t: s for t, s in speeds.items() if s != sent[t]}
+        if changed:
+            # Resend the whole controller so its other channel keeps its speed
+            controllers = {tendons[t][0] for t in changed}
+            send_speeds({t: s for t, s in speeds.items() if tendons[t][0] in controllers})
+            for tendon, speed in changed.items():
+                recorder.speed(tendon, speed)
+                print("Motor %d %s" % (tendon, "Plus" if speed > 0 else "Minus" if speed < 0 else "Stop"))
+            sent = speeds
+        time.sleep(tick)
+    send_speeds({tendon: 0 for tendon in tendons})
 
 
 print("Use arrow keys for motors 1 and 2, and WASD for motors 3 and 4.")
 print("Press ESC to quit.")
 
+recorder = SessionRecorder(session_file, tendons,
+                           encoders=lambda: home.capture(tendons, controller_status))
+streamer = None
 try:
-    while True:
-        if keyboard.is_pressed("up"):
-            move_motor("up")
-            time.sleep(0.2)
-        elif keyboard.is_pressed("down"):
-            move_motor("down")
-            time.sleep(0.2)
-        elif keyboard.is_pressed("left"):
-            move_motor("left")
-            time.sleep(0.2)
-        elif keyboard.is_pressed("right"):
-            move_motor("right")
-            time.sleep(0.2)
-        elif keyboard.is_pressed("w"):
-            move_motor("w")
-            time.sleep(0.2)
-        elif keyboard.is_pressed("s"):
-            move_motor("s")
-            time.sleep(0.2)
-        elif keyboard.is_pressed("a"):
-            move_motor("a")
-            time.sleep(0.2)
-        elif keyboard.is_pressed("d"):
-            move_motor("d")
-            time.sleep(0.2)
-        elif keyboard.is_pressed("esc"):
-            print("Exiting...")
-            break
+    for key in KEYS:
+        keyboard.on_press_key(key, lambda event, key=key: key_down(key))
+        keyboard.on_release_key(key, lambda event, key=key: key_up(key))
+    if not step_mode:
+        streamer = threading.Thread(target=stream, daemon=True)
+        streamer.start()
+    keyboard.wait('esc')
+    print("Exiting...")
 except KeyboardInterrupt:
-    print("Program stopped by user.")
\ No newline at end of file
+    print("Program stopped by user.")
+finally:
+    keyboard.unhook_all()
+    stop.set()
+    if streamer is not None:
+        streamer.join()
+    recorder.close()